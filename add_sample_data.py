@@ -9,7 +9,8 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from db.patient_repo import create_patient
 from db.visit_repo import create_visit
 from db.connection import get_db
-import json
+from ml.model import risk_features
+from datetime import datetime
 
 print("=" * 70)
 print("ADDING SAMPLE PATIENTS AND VISITS FOR DEMO")
@@ -94,11 +95,12 @@ for data in sample_data:
         visit_id = create_visit(
             patient_phone=data["phone"],
             symptoms_raw=data["symptoms"],
-            symptoms_list=json.dumps([data["symptoms"]]),
+            symptoms_list=[data["symptoms"]],
             risk_score=data["risk_score"],
             risk_level=data["risk_level"],
             assigned_tier=data["tier"],
-            ai_summary=data["ai_summary"]
+            ai_summary=data["ai_summary"],
+            risk_features=risk_features(data["symptoms"], datetime.now().year - data["yob"])
         )
         
         # If completed, mark it as completed
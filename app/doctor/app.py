@@ -14,10 +14,19 @@ from db.visit_repo import (
     get_next_visit_for_tier, 
     mark_visit_completed, 
     get_visit_by_id,
-    get_waiting_visits,
-    get_completed_visits
+    get_completed_visits_page,
+    search_visits,
+    get_queue_stats,
+    renew_claim,
+    release_visit,
+    get_claimed_visit,
+    complete_and_claim_next,
+    release_expired_claims
 )
 from db.patient_repo import get_patient_by_phone
+from db.schema import ensure_schema
+from db.maintenance import start_maintenance_thread
+from db.queue_engine import get_queue_engine
 
 # Page config with white mode and hospital colors
 st.set_page_config(
@@ -27,6 +36,14 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Apply pending schema migrations and start db maintenance once per server process
+@st.cache_resource(show_spinner=False)
+def prepare_database():
+    ensure_schema()
+    start_maintenance_thread()
+
+prepare_database()
+
 # Configure Streamlit theme for white mode with hospital colors
 st.markdown("""
 <style>
@@ -645,6 +662,11 @@ if 'last_refresh' not in st.session_state:
     st.session_state.last_refresh = time.time()
 if 'show_history' not in st.session_state:
     st.session_state.show_history = False
+if 'history_visits' not in st.session_state:
+    st.session_state.history_visits = []
+    st.session_state.history_cursor = None
+    st.session_state.history_loaded = False
+    st.session_state.history_query = ''
 
 def login_page():
     # Centered login card
@@ -710,6 +732,41 @@ def complete_visit(visit_id, diagnosis, prescription):
         st.error(f"Error completing visit: {e}")
         return False
 
+def complete_and_next(visit_id, diagnosis, tier):
+    try:
+        completed, next_visit = complete_and_claim_next(
+            visit_id, st.session_state.doctor_info['id'], diagnosis, tier
+        )
+        if not completed:
+            st.error("This visit was reassigned after your claim expired.")
+        return completed, next_visit
+    except Exception as e:
+        st.error(f"Error completing visit: {e}")
+        return False, None
+
+HISTORY_PAGE_SIZE = 20
+
+def reset_history():
+    """Forget loaded history pages so the next view starts from the newest"""
+    st.session_state.history_visits = []
+    st.session_state.history_cursor = None
+    st.session_state.history_loaded = False
+
+def load_history_page(tier, query=''):
+    """Append the next page of history (keyset cursor), or of search results for `query`"""
+    if query:
+        visits, cursor = search_visits(
+            query, tier=tier, status='COMPLETED', limit=HISTORY_PAGE_SIZE,
+            cursor=st.session_state.history_cursor
+        )
+    else:
+        visits, cursor = get_completed_visits_page(
+            tier, st.session_state.history_cursor, HISTORY_PAGE_SIZE
+        )
+    st.session_state.history_visits.extend(visits)
+    st.session_state.history_cursor = cursor
+    st.session_state.history_loaded = True
+
 def dashboard():
     doc = st.session_state.doctor_info
     
@@ -752,13 +809,33 @@ def dashboard():
                     type="primary" if st.session_state.show_history else "secondary",
                     key="tab_history"):
             st.session_state.show_history = True
+            reset_history()
             st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Main Content
     if not st.session_state.show_history:
         # LIVE QUEUE VIEW - Left Panel + Center Panel Layout
-        queue = get_waiting_visits(doc['role_tier'])
+        release_expired_claims()
+        
+        # Keep our claim alive while the consultation is open, or pick up
+        # a claim we still hold (e.g. after a page reload)
+        current = st.session_state.get('current_patient')
+        if current:
+            if not renew_claim(current['id'], doc['id']):
+                st.warning("Your claim on this patient expired and they were returned to the queue.")
+                del st.session_state.current_patient
+        else:
+            claimed = get_claimed_visit(doc['id'])
+            if claimed:
+                st.session_state.current_patient = claimed
+        
+        # Queue comes from the in-memory engine; it only re-reads the table
+        # when another connection has committed something since last time
+        engine = get_queue_engine()
+        engine.sync()
+        queue = engine.waiting(doc['role_tier'])
+        stats = get_queue_stats(doc['role_tier']) or {}
         
         # Two-column layout: Queue (Left) | Consultation (Center/Right)
         col_queue, col_consult = st.columns([1, 2], gap="large")
@@ -772,6 +849,21 @@ def dashboard():
                 </div>
             """, unsafe_allow_html=True)
             
+            if stats.get('in_progress_count') or stats.get('oldest_waiting_at'):
+                avg_risk = stats.get('avg_waiting_risk')
+                st.caption(
+                    f"🩺 {stats.get('in_progress_count', 0)} in consultation"
+                    + (f" • Avg risk {avg_risk:.2f}" if avg_risk is not None else "")
+                    + (f" • Waiting since {stats['oldest_waiting_at']}" if stats.get('oldest_waiting_at') else "")
+                )
+            
+            if queue and not st.session_state.get('current_patient'):
+                if st.button("▶️ Call Next Patient", type="primary", use_container_width=True, key="btn_next"):
+                    next_visit = engine.claim_next(doc['role_tier'], doc['id'])
+                    if next_visit:
+                        st.session_state.current_patient = next_visit
+                    st.rerun()
+            
             if not queue:
                 st.markdown("""
                     <div class="empty-state">
@@ -807,8 +899,15 @@ def dashboard():
                     """, unsafe_allow_html=True)
                     
                     if st.button(f"Select", key=f"btn_{visit_id}", use_container_width=True):
-                        st.session_state.current_patient = patient
-                        st.rerun()
+                        current = st.session_state.get('current_patient')
+                        if current:
+                            engine.release(current['id'], doc['id'])
+                        claimed = engine.claim(visit_id, doc['id'])
+                        if claimed:
+                            st.session_state.current_patient = claimed
+                            st.rerun()
+                        else:
+                            st.warning("Another doctor has already taken this patient.")
         
         with col_consult:
             # Center Panel: Current Consultation
@@ -875,12 +974,12 @@ def dashboard():
                 # Doctor Actions
                 st.markdown('<div class="section-label">📝 Diagnosis & Treatment</div>', unsafe_allow_html=True)
                 
-                diagnosis = st.text_area("Doctor's Notes / Diagnosis", height=100, placeholder="Enter your diagnosis...")
-                prescription = st.text_area("Prescription", height=100, placeholder="Medication name, dosage, frequency...")
+                diagnosis = st.text_area("Doctor's Notes / Diagnosis", height=100, placeholder="Enter your diagnosis...", key=f"diagnosis_{p['id']}")
+                prescription = st.text_area("Prescription", height=100, placeholder="Medication name, dosage, frequency...", key=f"prescription_{p['id']}")
                 
                 st.write("")
                 
-                col_complete, col_skip = st.columns(2)
+                col_complete, col_next, col_skip = st.columns(3)
                 
                 with col_complete:
                     if st.button("✅ Complete Visit", type="primary", use_container_width=True):
@@ -892,8 +991,22 @@ def dashboard():
                         else:
                             st.warning("⚠️ Please enter a diagnosis")
                 
+                with col_next:
+                    if st.button("⏩ Complete & Next", use_container_width=True):
+                        if diagnosis:
+                            completed, next_visit = complete_and_next(p['id'], diagnosis, doc['role_tier'])
+                            if completed:
+                                if next_visit:
+                                    st.session_state.current_patient = next_visit
+                                else:
+                                    del st.session_state.current_patient
+                                st.rerun()
+                        else:
+                            st.warning("⚠️ Please enter a diagnosis")
+                
                 with col_skip:
                     if st.button("⏭️ Skip for Now", use_container_width=True):
+                        engine.release(p['id'], doc['id'])
                         del st.session_state.current_patient
                         st.rerun()
             else:
@@ -907,22 +1020,36 @@ def dashboard():
     
     else:
         # HISTORY VIEW - Redesigned
-        history = get_completed_visits(tier=doc['role_tier'], limit=20)
+        search_query = st.text_input(
+            "Search history", key="history_search_box",
+            placeholder="🔍 Search symptoms, AI summaries and notes (e.g. chest pain)",
+            label_visibility="collapsed"
+        ).strip()
+        if search_query != st.session_state.history_query:
+            reset_history()
+            st.session_state.history_query = search_query
+        
+        # Pages are kept in session state, so a rerun re-renders them
+        # without querying; only "Load more" fetches the next page
+        if not st.session_state.history_loaded:
+            load_history_page(doc['role_tier'], search_query)
+        history = st.session_state.history_visits
+        has_more = st.session_state.history_cursor is not None
         
         st.markdown('<div class="main-content">', unsafe_allow_html=True)
         
         st.markdown(f"""
             <div class="history-header">
                 <div class="history-title">📚 Consultation History</div>
-                <div class="history-count">{len(history)} completed</div>
+                <div class="history-count">{len(history)}{'+' if has_more else ''} {'matches' if search_query else 'completed'}</div>
             </div>
         """, unsafe_allow_html=True)
         
         if not history:
-            st.markdown("""
+            st.markdown(f"""
                 <div class="empty-state">
                     <div class="empty-icon">📋</div>
-                    <div>No completed consultations yet</div>
+                    <div>{'No consultations match your search' if search_query else 'No completed consultations yet'}</div>
                 </div>
             """, unsafe_allow_html=True)
         else:
@@ -956,6 +1083,8 @@ def dashboard():
                         </div>
                     </div>
                 """, unsafe_allow_html=True)
+                if h.get('snippet'):
+                    st.caption(f"🔎 {h['snippet']}")
                 
                 # Expandable details
                 with st.expander("View Details", expanded=False):
@@ -1038,6 +1167,10 @@ def dashboard():
                         """, unsafe_allow_html=True)
                     
                     st.markdown('</div>', unsafe_allow_html=True)
+            
+            if has_more and st.button("⬇️ Load more", use_container_width=True, key="history_more"):
+                load_history_page(doc['role_tier'], search_query)
+                st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1050,6 +1183,7 @@ def dashboard():
             st.session_state.doctor_info = None
             st.session_state.show_history = False
             if 'current_patient' in st.session_state:
+                release_visit(st.session_state.current_patient['id'], doc['id'])
                 del st.session_state.current_patient
             st.rerun()
 
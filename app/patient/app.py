@@ -8,11 +8,14 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from ai.processing import transcribe_audio, extract_patient_data, extract_from_text
 from ai.summary import generate_doctor_summary
-from ml.model import predict_risk_score
-import json
+from ml.model import predict_risk_score, risk_features
 from datetime import datetime
-from db.patient_repo import get_patient_by_phone, create_patient, verify_patient, update_patient_name
-from db.visit_repo import create_visit, get_queue_position, get_previous_visits
+from db.patient_repo import check_in_patient, update_patient_name
+from db.visit_repo import get_previous_visits
+from db.queue_engine import get_queue_engine
+from db.schema import ensure_schema
+from db.retry import is_busy_error
+from db.maintenance import start_maintenance_thread
 
 # ===== PAGE CONFIG =====
 st.set_page_config(
@@ -22,6 +25,14 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Apply pending schema migrations and start db maintenance once per server process
+@st.cache_resource(show_spinner=False)
+def prepare_database():
+    ensure_schema()
+    start_maintenance_thread()
+
+prepare_database()
+
 # ===== MINIMAL CSS - NO STREAMLIT OVERRIDES =====
 st.markdown("""
 <style>
@@ -73,6 +84,10 @@ HEALTH_TIPS = [
 def rotate_health_tip():
     st.session_state.health_tip_index = (st.session_state.health_tip_index + 1) % len(HEALTH_TIPS)
 
+# Shown instead of the raw exception when the database stays locked
+# through every retry (see db/retry.py)
+BUSY_MESSAGE = "⏳ We're handling a lot of check-ins right now. Please wait a few seconds and try again."
+
 # ===== SCREEN 1: LOGIN =====
 def show_login_screen():
     st.title("🏥 AarogyaQueue")
@@ -106,27 +121,22 @@ def show_login_screen():
             if len(phone) == 10 and len(yob) == 4:
                 try:
                     yob_int = int(yob)
-                    patient = get_patient_by_phone(phone)
+                    # Registers new numbers, verifies known ones
+                    patient = check_in_patient(phone, yob_int)
                     
                     if patient:
-                        if patient['yob'] == yob_int:
-                            st.session_state.authenticated = True
-                            st.session_state.patient_phone = phone
-                            st.session_state.patient_data = patient
-                            st.session_state.current_screen = 'registration'
-                            st.rerun()
-                        else:
-                            st.error("❌ Invalid year of birth. Please try again.")
-                    else:
-                        new_patient = create_patient(phone, yob_int)
                         st.session_state.authenticated = True
                         st.session_state.patient_phone = phone
-                        st.session_state.patient_data = new_patient
+                        st.session_state.patient_data = patient
                         st.session_state.current_screen = 'registration'
-                        st.success("✅ New patient registered!")
                         st.rerun()
+                    else:
+                        st.error("❌ Invalid year of birth. Please try again.")
                 except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+                    if is_busy_error(e):
+                        st.error(BUSY_MESSAGE)
+                    else:
+                        st.error(f"❌ Error: {str(e)}")
             else:
                 st.warning("⚠️ Please enter valid 10-digit phone and 4-digit year")
     
@@ -284,7 +294,9 @@ def process_registration(name, age, symptoms):
         risk_level = 'HIGH' if risk_score > 0.7 else ('MEDIUM' if risk_score > 0.4 else 'LOW')
         
         if name and name != st.session_state.patient_data.get('name'):
-            update_patient_name(st.session_state.patient_phone, name)
+            patient = update_patient_name(st.session_state.patient_phone, name)
+            if patient:
+                st.session_state.patient_data = patient
         
         previous_visits = get_previous_visits(st.session_state.patient_phone, limit=3)
         
@@ -296,19 +308,24 @@ def process_registration(name, age, symptoms):
         )
         
         symptoms_list = [symptoms]
-        visit_id = create_visit(
+        engine = get_queue_engine()
+        # create_visit() does the JSON encoding of symptoms_list and features
+        visit_id = engine.enqueue(
             st.session_state.patient_phone,
             symptoms,
-            json.dumps(symptoms_list),
+            symptoms_list,
             float(risk_score),
             risk_level,
             assigned_tier,
-            ai_summary
+            ai_summary,
+            risk_features(symptoms, age)
         )
         
-        queue_position = get_queue_position(assigned_tier)
+        engine.sync()
+        queue_position = engine.rank(visit_id) or 0
         
         st.session_state.token_data = {
+            'visit_id': visit_id,
             'token': f"{visit_id:08d}",
             'tier': assigned_tier,
             'wait_time': queue_position * 8,
@@ -320,7 +337,10 @@ def process_registration(name, age, symptoms):
         st.rerun()
         
     except Exception as e:
-        st.error(f"❌ Error creating visit: {str(e)}")
+        if is_busy_error(e):
+            st.error(BUSY_MESSAGE)
+        else:
+            st.error(f"❌ Error creating visit: {str(e)}")
 
 # ===== SCREEN 3: SUCCESS & QUEUE STATUS =====
 def show_success_screen():
@@ -356,9 +376,9 @@ def show_success_screen():
     with status_col2:
         st.metric(
             label="📍 Your Position",
-            value=f"#{token.get('queue_position', 1)}",
-            delta="in queue",
-            help="Number of patients ahead of you"
+            value=f"#{token['queue_position']}" if token.get('queue_position') else "Now",
+            delta="in queue" if token.get('queue_position') else "with doctor",
+            help="Your place in the queue, ordered by priority and arrival time"
         )
     
     with status_col3:
@@ -413,7 +433,9 @@ def show_success_screen():
     
     with action_col1:
         if st.button("🔄 **CHECK QUEUE STATUS**", use_container_width=True):
-            updated_position = get_queue_position(token['tier'])
+            engine = get_queue_engine()
+            engine.sync()
+            updated_position = engine.rank(token['visit_id']) or 0
             st.session_state.token_data['queue_position'] = updated_position
             st.session_state.token_data['wait_time'] = updated_position * 8
             st.rerun()
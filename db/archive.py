@@ -0,0 +1,111 @@
+"""
+Hot/cold split for visits.
+
+COMPLETED visits older than ARCHIVE_AFTER_DAYS are moved out of the live
+`visits` table into `visits_archive` in a separate file that every pooled
+connection ATTACHes as `archive` (see db/connection.py). History queries
+read the TEMP view `all_visits`, which unions both, so callers never need
+to know where a visit lives. The live table then only holds the queue and
+recent history, which keeps its pages hot in the cache.
+
+Nothing in the apps schedules the move (the maintenance thread of
+db/maintenance.py does not archive); run it from cron, e.g. nightly:
+  python3 scripts/archive_visits.py
+"""
+import json
+import os
+import time
+from db.connection import get_db
+from db.migrations import BACKFILL_PAUSE, NOW_MS
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = 500
+
+ARCHIVE_INDEXES = [
+    """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_patient_history
+       ON visits_archive (patient_phone, status, created_at_ms)""",
+    """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_tier_completed
+       ON visits_archive (assigned_tier, status, completed_at_ms, id)""",
+    """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_completed
+       ON visits_archive (status, completed_at_ms, id)""",
+]
+
+def _live_columns(conn):
+    return [(row[1], row[2]) for row in conn.execute('PRAGMA main.table_info(visits)')]
+
+def create_archive_table(conn, indexes=ARCHIVE_INDEXES):
+    """Create archive.visits_archive mirroring visits, or add missing columns.
+
+    Call again from any migration that adds a column to visits so both
+    sides of the all_visits view stay in step. Migrations older than the
+    current ARCHIVE_INDEXES pass the index DDL they shipped with.
+    """
+    live = _live_columns(conn)
+    archived = {row[1] for row in conn.execute('PRAGMA archive.table_info(visits_archive)')}
+    if not archived:
+        columns = ',\n'.join(
+            'id INTEGER PRIMARY KEY' if name == 'id' else f'{name} {decl}'
+            for name, decl in live
+        )
+        conn.execute(f'CREATE TABLE archive.visits_archive (\n{columns}\n)')
+    else:
+        for name, decl in live:
+            if name not in archived:
+                conn.execute(f'ALTER TABLE archive.visits_archive ADD COLUMN {name} {decl}')
+    for statement in indexes:
+        conn.execute(statement)
+
+def archive_completed_visits(older_than_days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move COMPLETED visits older than the cutoff into the archive.
+
+    Each batch is two transactions. The first copies the rows into the
+    archive (INSERT OR REPLACE). The second deletes from the live table
+    only ids that are in the archive. Both files are in WAL mode, where a
+    transaction writing to both is not atomic across them, so a crash
+    mid-commit could drop rows from main before the archive had them. Now
+    a crash between the two only leaves rows in both files: all_visits
+    shows the live copy alone, and the next run copies and deletes them
+    again. Returns the number of visits moved.
+    """
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    with get_db() as conn:
+        archived = {row[1] for row in conn.execute('PRAGMA archive.table_info(visits_archive)')}
+        shared = [name for name, _ in _live_columns(conn) if name in archived]
+    if not shared:
+        return 0
+    columns = ', '.join(shared)
+
+    moved = 0
+    while True:
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            ids = [row[0] for row in conn.execute(f'''
+                SELECT id FROM main.visits
+                WHERE status = 'COMPLETED' AND completed_at_ms < {NOW_MS} - {int(days) * 86400000}
+                ORDER BY completed_at_ms, id
+                LIMIT ?
+            ''', (batch_size,))]
+            if ids:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO archive.visits_archive ({columns})
+                    SELECT {columns} FROM main.visits WHERE id IN (SELECT value FROM json_each(?))
+                ''', (json.dumps(ids),))
+        if not ids:
+            return moved
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute('''
+                DELETE FROM main.visits
+                WHERE id IN (SELECT value FROM json_each(?))
+                  AND id IN (SELECT id FROM archive.visits_archive)
+            ''', (json.dumps(ids),))
+            moved += cursor.rowcount
+        if len(ids) < batch_size:
+            return moved
+        time.sleep(BACKFILL_PAUSE)
+
+def get_archive_stats():
+    with get_db() as conn:
+        live = conn.execute('SELECT COUNT(*) FROM main.visits').fetchone()[0]
+        archived = conn.execute('SELECT COUNT(*) FROM archive.visits_archive').fetchone()[0]
+        return {'live_visits': live, 'archived_visits': archived}
@@ -0,0 +1,56 @@
+"""
+Background-thread executor that lets asyncio code call the repositories.
+
+The sync repositories borrow pooled connections (db/connection.py), so
+running them on a thread pool gives each in-flight call its own connection.
+Reads go through the read-only pool and proceed in parallel under WAL;
+writes queue on SQLite's single writer lock as they would anyway.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db.connection import POOL_SIZE, READ_POOL_SIZE
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=POOL_SIZE + READ_POOL_SIZE,
+                    thread_name_prefix='db'
+                )
+    return _executor
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+async def run_in_db_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+def make_async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db_thread(func, *args, **kwargs)
+    return wrapper
+
+def mirror(module, namespace):
+    """Add an async twin of every public function of `module` to `namespace`"""
+    names = []
+    for name, func in inspect.getmembers(module, inspect.isfunction):
+        if name.startswith('_') or func.__module__ != module.__name__:
+            continue
+        namespace[name] = make_async(func)
+        names.append(name)
+    return names
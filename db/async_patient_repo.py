@@ -0,0 +1,10 @@
+"""
+asyncio mirror of db.patient_repo - same function names and return shapes.
+
+    from db import async_patient_repo as patients
+    patient = await patients.get_patient_by_phone(phone)
+"""
+from db import patient_repo
+from db.async_executor import mirror
+
+__all__ = mirror(patient_repo, globals())
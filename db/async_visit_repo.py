@@ -0,0 +1,10 @@
+"""
+asyncio mirror of db.visit_repo - same function names and return shapes.
+
+    from db import async_visit_repo as visits
+    queue = await visits.get_waiting_visits('SENIOR')
+"""
+from db import visit_repo
+from db.async_executor import mirror
+
+__all__ = mirror(visit_repo, globals())
@@ -0,0 +1,166 @@
+"""
+Online backups of the live database with the sqlite3 backup API.
+
+`backup_database()` copies `pages` pages per step and sleeps between steps,
+so the copy never holds a lock for long and kiosks keep writing. The live
+file and its archive (see db/archive.py) are copied as a pair, and the
+copy follows the same `<name>_archive.db` naming, so a backup opens like
+the live database: `get_connection(path, read_only=True)`. Both files
+are read from one snapshot of the source.
+
+Copies are switched to journal_mode=DELETE, which makes each one a single
+self-contained file.
+
+  create_backup()             timestamped copy in BACKUP_DIR, keeps BACKUP_KEEP
+  create_reporting_snapshot() consistent read-only copy for reports/exports
+
+Run from cron:  python3 scripts/backup_db.py [--snapshot]
+"""
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from db import connection
+from db.connection import get_archive_path, get_connection, get_db
+
+BACKUP_DIR = os.getenv("DB_BACKUP_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'backups'
+)
+BACKUP_KEEP = int(os.getenv("DB_BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.getenv("DB_BACKUP_PAGES", "1024"))
+BACKUP_SLEEP = float(os.getenv("DB_BACKUP_SLEEP", "0.005"))  # seconds between steps
+
+# backup_database() copies from a read transaction it holds open, so writes
+# from other connections no longer restart a stepped backup. If one is
+# restarted anyway, after this many restarts the copy is finished in one step.
+MAX_RESTARTS = 3
+
+class _Restarted(Exception):
+    pass
+
+def _copy(source, dest_path, name, pages, sleep):
+    """Back up schema `name` of `source` into a fresh file at dest_path"""
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _Restarted()
+        last_remaining = remaining
+
+    tmp_path = dest_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        try:
+            source.backup(dest, pages=pages, name=name, progress=progress, sleep=sleep)
+        except _Restarted:
+            source.backup(dest, pages=-1, name=name)
+        dest.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dest.close()
+    # Readers of dest_path only ever see a complete copy
+    os.replace(tmp_path, dest_path)
+    return restarts
+
+def _begin_snapshot(source, schemas):
+    """Open one read transaction on `source` covering every schema in `schemas`.
+
+    The snapshots are taken while a write lock holds other writers off, so
+    main and archive are read as of the same commit. In WAL mode readers do
+    not see a commit spanning both files atomically, and an archive move
+    caught halfway would be copied twice (or not at all).
+    """
+    with get_db() as lock:
+        lock.execute('BEGIN IMMEDIATE')
+        source.execute('BEGIN')
+        for name in schemas:
+            source.execute(f'SELECT COUNT(*) FROM {name}.sqlite_master').fetchone()
+
+def backup_database(dest_path, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Copy the live database (and its archive, if any) to dest_path.
+
+    Both files are copied from the same read transaction, so the pair is a
+    point-in-time copy: a visit is never in both, or in neither.
+    """
+    start = time.perf_counter()
+    source = get_connection(read_only=True)
+    try:
+        has_archive = source.execute(
+            "SELECT 1 FROM pragma_database_list WHERE name = 'archive'"
+        ).fetchone() is not None
+        _begin_snapshot(source, ['main', 'archive'] if has_archive else ['main'])
+        restarts = _copy(source, dest_path, 'main', pages, sleep)
+        archive_path = None
+        if has_archive:
+            archive_path = get_archive_path(dest_path)
+            restarts += _copy(source, archive_path, 'archive', pages, sleep)
+    finally:
+        source.close()
+    return {
+        'path': dest_path,
+        'archive_path': archive_path,
+        'bytes': os.path.getsize(dest_path) + (os.path.getsize(archive_path) if archive_path else 0),
+        'restarts': restarts,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+def _backup_prefix():
+    return os.path.splitext(os.path.basename(connection.DB_PATH))[0] + '-'
+
+def list_backups():
+    """Rotating backups in BACKUP_DIR, newest first"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    prefix = _backup_prefix()
+    names = [
+        name for name in os.listdir(BACKUP_DIR)
+        if name.startswith(prefix) and name.endswith('.db') and not name.endswith('_archive.db')
+    ]
+    return [os.path.join(BACKUP_DIR, name) for name in sorted(names, reverse=True)]
+
+def rotate_backups(keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backups; returns the removed paths"""
+    removed = []
+    for path in list_backups()[keep:]:
+        for file_path in (path, get_archive_path(path)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        removed.append(path)
+    return removed
+
+def create_backup(keep=BACKUP_KEEP, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Timestamped backup in BACKUP_DIR, then drop the oldest beyond `keep`"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    # Microseconds, so two backups in the same second get separate files
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(BACKUP_DIR, f'{_backup_prefix()}{stamp}.db')
+    if os.path.exists(path):
+        raise FileExistsError(f"backup {path} already exists")
+    result = backup_database(path, pages, sleep)
+    result['removed'] = rotate_backups(keep)
+    return result
+
+def get_snapshot_path():
+    return os.path.splitext(connection.DB_PATH)[0] + '_snapshot.db'
+
+def create_reporting_snapshot(path=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Refresh the read-only snapshot used by reports and exports.
+
+    Heavy analytics should read the snapshot through
+    `open_reporting_snapshot()` rather than the live file, so they never
+    compete with kiosk traffic.
+    """
+    return backup_database(path or get_snapshot_path(), pages, sleep)
+
+def open_reporting_snapshot(path=None):
+    """Read-only connection to the snapshot (with `all_visits`, like the live db)"""
+    path = path or get_snapshot_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"no snapshot at {path}; run create_reporting_snapshot() first")
+    return get_connection(path, read_only=True)
@@ -1,17 +1,234 @@
-import sqlite3
+# Database module
 import os
+import queue
+import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'telemedicine_queue.db')
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Completed visits are moved here by db/archive.py (ATTACHed as `archive`).
+# Defaults to <db name>_archive.db next to the live database.
+ARCHIVE_PATH = os.getenv("DB_ARCHIVE_PATH")
+
+# Pool sizing (per process, shared by all Streamlit sessions)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Per-connection pragmas applied when a pooled connection is opened
+PRAGMAS = {
+    'synchronous': os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    'cache_size': int(os.getenv("DB_CACHE_SIZE", "-16000")),  # negative = KiB
+    'mmap_size': int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    'busy_timeout': int(os.getenv("DB_BUSY_TIMEOUT", "5000")),  # ms
+}
+
+def _apply_pragmas(conn, read_only=False):
+    if not read_only:
+        # Only takes effect on a new, empty file; see db/maintenance.py
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f"PRAGMA synchronous = {PRAGMAS['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(PRAGMAS['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(PRAGMAS['mmap_size'])}")
+    conn.execute(f"PRAGMA busy_timeout = {int(PRAGMAS['busy_timeout'])}")
+
+def get_archive_path(db_path=None):
+    if ARCHIVE_PATH and (db_path is None or db_path == DB_PATH):
+        return ARCHIVE_PATH
+    return os.path.splitext(db_path or DB_PATH)[0] + '_archive.db'
+
+def _attach_archive(conn, db_path, read_only):
+    """ATTACH the archive file and define the TEMP view `all_visits`.
+
+    all_visits = live visits UNION ALL archived visits, over the columns both
+    tables share; history queries read it so archiving is transparent. A
+    visit caught between the two steps of an archive move is in both
+    tables; the view shows only its live copy.
+    Before the archive table exists the view is just the live table.
+    """
+    archive_path = get_archive_path(db_path)
+    shared = None
+    if not read_only or os.path.exists(archive_path):
+        if read_only:
+            conn.execute('ATTACH DATABASE ? AS archive', (f'file:{archive_path}?mode=ro',))
+        else:
+            conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+            conn.execute('PRAGMA archive.auto_vacuum = INCREMENTAL')
+            conn.execute('PRAGMA archive.journal_mode = WAL')
+        # table_xinfo also lists generated columns (the risk feature flags)
+        archived = {row[1] for row in conn.execute('PRAGMA archive.table_xinfo(visits_archive)')}
+        if archived:
+            shared = [row[1] for row in conn.execute('PRAGMA main.table_xinfo(visits)')
+                      if row[1] in archived]
+    if shared:
+        columns = ', '.join(shared)
+        conn.execute(f'''
+            CREATE TEMP VIEW all_visits AS
+            SELECT {columns} FROM main.visits
+            UNION ALL
+            SELECT {columns} FROM archive.visits_archive a
+            WHERE NOT EXISTS (SELECT 1 FROM main.visits m WHERE m.id = a.id)
+        ''')
+    else:
+        conn.execute('CREATE TEMP VIEW all_visits AS SELECT * FROM main.visits')
+
+def get_connection(db_path=None, read_only=False):
+    """Open a new, fully configured connection (not pooled)"""
+    db_path = db_path or DB_PATH
+    if read_only:
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        # Writers take the lock when their transaction starts (BEGIN
+        # IMMEDIATE) rather than upgrading a read lock mid-transaction,
+        # which is where SQLITE_BUSY deadlocks come from.
+        conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level='IMMEDIATE')
     conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn, read_only)
+    _attach_archive(conn, db_path, read_only)
+    if read_only:
+        conn.execute('PRAGMA query_only = ON')
     return conn
 
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to `size` and handed out LIFO so the
+    most recently used (warmest page cache) connection is reused first.
+    """
+
+    def __init__(self, db_path, size, read_only=False, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.read_only = read_only
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._timeouts = 0
+        self._closed = False
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = get_connection(self.db_path, self.read_only)
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise sqlite3.OperationalError(
+                        f"connection pool exhausted ({self.size} connections in use)"
+                    )
+                with self._lock:
+                    self._waits += 1
+                    self._wait_seconds += time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it and let the pool open a fresh one
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+    def stats(self):
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                'db_path': self.db_path,
+                'read_only': self.read_only,
+                'size': self.size,
+                'open': self._opened,
+                'idle': idle,
+                'in_use': self._opened - idle,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_ms_total': round(self._wait_seconds * 1000, 3),
+                'timeouts': self._timeouts,
+            }
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(read_only=False):
+    """Return the process-wide pool for the current DB_PATH"""
+    key = (DB_PATH, read_only)
+    pool = _pools.get(key)
+    if pool is None:
+        if read_only:
+            # A read-only connection cannot create the file or switch it to
+            # WAL, so make sure the writer pool has touched it first.
+            writer = get_pool(read_only=False)
+            writer.release(writer.acquire())
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                size = READ_POOL_SIZE if read_only else POOL_SIZE
+                pool = _pools[key] = ConnectionPool(DB_PATH, size, read_only)
+    return pool
+
+def get_pool_stats():
+    """Statistics for every open pool, keyed by 'write' / 'read'"""
+    stats = {}
+    for (path, read_only), pool in list(_pools.items()):
+        if path == DB_PATH:
+            stats['read' if read_only else 'write'] = pool.stats()
+    return stats
+
+def close_pools():
+    """Close every pooled connection (e.g. before replacing the db file)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
 @contextmanager
 def get_db():
-    conn = get_connection()
+    pool = get_pool()
+    conn = pool.acquire()
     try:
         yield conn
         conn.commit()
@@ -19,4 +236,14 @@ def get_db():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        pool.release(conn)
+
+@contextmanager
+def get_read_db():
+    """Read-only pooled connection for queries (dashboards, lookups)"""
+    pool = get_pool(read_only=True)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
@@ -0,0 +1,175 @@
+"""
+Routine SQLite upkeep for the live database.
+
+`run_maintenance()` does one pass:
+  - PRAGMA optimize (a full ANALYZE the first time, when there are no stats)
+  - a bounded `incremental_vacuum` step that returns free pages to the OS
+  - a WAL checkpoint: PASSIVE normally, TRUNCATE once the -wal file has
+    grown past WAL_TRUNCATE_BYTES
+  - pruning of change-feed events older than EVENT_RETENTION_HOURS
+
+Every step is short, so it is safe while kiosks are writing. The apps run it
+from a daemon thread (`start_maintenance_thread()`); cron can run
+scripts/maintain_db.py instead.
+
+auto_vacuum=INCREMENTAL is set on every new database by db/connection.py.
+An existing file only switches after one full VACUUM:
+`enable_incremental_vacuum()` (or `maintain_db.py --enable-auto-vacuum`).
+"""
+import logging
+import os
+import threading
+import time
+
+from db import connection
+from db.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL = float(os.getenv("DB_MAINTENANCE_INTERVAL", "600"))  # seconds
+VACUUM_STEP_PAGES = int(os.getenv("DB_VACUUM_STEP_PAGES", "1000"))
+WAL_TRUNCATE_BYTES = int(os.getenv("DB_WAL_TRUNCATE_BYTES", str(64 * 1024 * 1024)))
+EVENT_RETENTION_HOURS = int(os.getenv("VISIT_EVENT_RETENTION_HOURS", "24"))
+
+AUTO_VACUUM_MODES = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+def _wal_size(db_path):
+    try:
+        return os.path.getsize(db_path + '-wal')
+    except OSError:
+        return 0
+
+def enable_incremental_vacuum():
+    """Switch an existing database to auto_vacuum=INCREMENTAL (one full VACUUM).
+
+    VACUUM rewrites the whole file and blocks writers while it runs, so do
+    this in a quiet window. Returns the auto_vacuum mode afterwards.
+    """
+    with get_db() as conn:
+        mode = conn.execute('PRAGMA main.auto_vacuum').fetchone()[0]
+        if mode != 2:
+            conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM main')
+            mode = conn.execute('PRAGMA main.auto_vacuum').fetchone()[0]
+        return AUTO_VACUUM_MODES[mode]
+
+def optimize(conn):
+    has_stats = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone()
+    if has_stats:
+        conn.execute('PRAGMA optimize')
+        return 'optimize'
+    conn.execute('ANALYZE')
+    return 'analyze'
+
+def incremental_vacuum(conn, pages=VACUUM_STEP_PAGES):
+    """Free up to `pages` pages; returns (pages freed, pages still free)"""
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+        return 0, conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    before = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    if before:
+        # executescript steps the pragma to completion; a plain execute()
+        # stops after the first step, which frees a single page
+        conn.executescript(f'PRAGMA main.incremental_vacuum({int(pages)});')
+    after = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    return before - after, after
+
+def checkpoint(conn, db_path, truncate_bytes=WAL_TRUNCATE_BYTES):
+    """PASSIVE checkpoint, or TRUNCATE once the WAL is over the threshold"""
+    wal_before = _wal_size(db_path)
+    mode = 'TRUNCATE' if wal_before >= truncate_bytes else 'PASSIVE'
+    busy, wal_pages, checkpointed = conn.execute(f'PRAGMA main.wal_checkpoint({mode})').fetchone()
+    return {
+        'mode': mode,
+        'busy': bool(busy),
+        'wal_pages': wal_pages,
+        'checkpointed_pages': checkpointed,
+        'wal_bytes_before': wal_before,
+        'wal_bytes_after': _wal_size(db_path),
+    }
+
+def run_maintenance(vacuum_pages=None, truncate_bytes=None):
+    """One maintenance pass; returns (and logs) what it did"""
+    from db.visit_repo import prune_visit_events
+
+    start = time.perf_counter()
+    db_path = connection.DB_PATH
+    report = {}
+    with get_db() as conn:
+        page_size = conn.execute('PRAGMA main.page_size').fetchone()[0]
+        step = time.perf_counter()
+        report['stats'] = optimize(conn)
+        report['optimize_ms'] = round((time.perf_counter() - step) * 1000, 1)
+
+        step = time.perf_counter()
+        freed, still_free = incremental_vacuum(
+            conn, VACUUM_STEP_PAGES if vacuum_pages is None else vacuum_pages
+        )
+        report['vacuum_ms'] = round((time.perf_counter() - step) * 1000, 1)
+        report['vacuum_freed_bytes'] = freed * page_size
+        report['free_bytes_left'] = still_free * page_size
+    report['events_pruned'] = prune_visit_events(EVENT_RETENTION_HOURS)
+    # Checkpoint last, after our own writes, on a connection with no open
+    # transaction so TRUNCATE can reset the file
+    with get_db() as conn:
+        step = time.perf_counter()
+        report['checkpoint'] = checkpoint(
+            conn, db_path, WAL_TRUNCATE_BYTES if truncate_bytes is None else truncate_bytes
+        )
+        report['checkpoint_ms'] = round((time.perf_counter() - step) * 1000, 1)
+    report['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    cp = report['checkpoint']
+    logger.info(
+        "db maintenance in %.1f ms: %s %.1f ms, vacuum freed %d bytes (%d free) in %.1f ms, "
+        "%d events pruned, %s checkpoint %d/%d pages%s, WAL %d -> %d bytes in %.1f ms",
+        report['total_ms'], report['stats'], report['optimize_ms'],
+        report['vacuum_freed_bytes'], report['free_bytes_left'], report['vacuum_ms'],
+        report['events_pruned'], cp['mode'], cp['checkpointed_pages'], cp['wal_pages'],
+        ' (busy)' if cp['busy'] else '', cp['wal_bytes_before'], cp['wal_bytes_after'],
+        report['checkpoint_ms'],
+    )
+    return report
+
+# ----- background thread -----
+
+_thread = None
+_stop = threading.Event()
+_thread_lock = threading.Lock()
+
+def _loop(interval):
+    while not _stop.wait(interval):
+        try:
+            run_maintenance()
+        except Exception:
+            # Keep the thread alive; the next pass may well succeed
+            logger.exception("db maintenance failed")
+
+def start_maintenance_thread(interval=None):
+    """Run maintenance every `interval` seconds in a daemon thread (once per process).
+
+    An interval of 0 (DB_MAINTENANCE_INTERVAL=0) disables the thread, e.g.
+    when cron runs scripts/maintain_db.py instead.
+    """
+    global _thread
+    interval = MAINTENANCE_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _stop.clear()
+            _thread = threading.Thread(
+                target=_loop, args=(interval,),
+                name='db-maintenance', daemon=True
+            )
+            _thread.start()
+    return _thread
+
+def stop_maintenance_thread(timeout=None):
+    global _thread
+    with _thread_lock:
+        _stop.set()
+        if _thread is not None:
+            _thread.join(timeout)
+            _thread = None
@@ -0,0 +1,547 @@
+"""
+Versioned schema migrations.
+
+`create_tables()` in db/schema.py is the baseline schema; every change after
+it is a numbered migration registered here with @migration. `migrate()`
+applies the pending ones in order and records each version in the
+`schema_version` table, so it is safe to call on every app start.
+
+Schema changes run in short BEGIN IMMEDIATE transactions. Data backfills run
+afterwards through `backfill()` in small committed batches, so kiosks can keep
+writing while a migration is rolling out against the live database.
+"""
+import json
+import time
+from db.connection import get_db, close_pools
+
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE = 0.01  # seconds between batches, lets other writers in
+
+MIGRATIONS = []
+
+def epoch_ms(expr):
+    """SQL converting a timestamp expression to integer epoch milliseconds"""
+    return f"CAST(ROUND((julianday({expr}) - 2440587.5) * 86400000) AS INTEGER)"
+
+# 'now' is fixed for the whole statement, so NOW_MS and CURRENT_TIMESTAMP
+# used in one statement describe the same instant
+NOW_MS = epoch_ms("'now'")
+
+def migration(version, description, backfill=None):
+    """Register a schema migration; `backfill` runs after the DDL commits"""
+    def register(func):
+        MIGRATIONS.append((version, description, func, backfill))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+def column_exists(conn, table, column):
+    cursor = conn.execute(f'PRAGMA table_info({table})')
+    return column in [row[1] for row in cursor.fetchall()]
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, skipped if the column is already there"""
+    if not column_exists(conn, table, column):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def backfill(select_sql, update, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE):
+    """Run a data backfill in small committed batches.
+
+    `select_sql` must return the rows still needing work (so a batch that
+    has been applied drops out of the next SELECT); `update(conn, rows)`
+    applies one batch. Returns the number of rows processed.
+    """
+    total = 0
+    while True:
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'{select_sql} LIMIT ?', (batch_size,)).fetchall()
+            if rows:
+                update(conn, rows)
+        if not rows:
+            return total
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+        time.sleep(pause)
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _applied_versions(conn):
+    return {row[0] for row in conn.execute('SELECT version FROM schema_version')}
+
+def get_schema_version():
+    with get_db() as conn:
+        _ensure_version_table(conn)
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+        return row[0] or 0
+
+def pending_migrations():
+    with get_db() as conn:
+        _ensure_version_table(conn)
+        applied = _applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+def _record(conn, version, description):
+    conn.execute(
+        'INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)',
+        (version, description)
+    )
+
+def migrate(verbose=False):
+    """Apply every pending migration; returns the list of versions applied"""
+    applied_now = []
+    for version, description, func, data_backfill in pending_migrations():
+        with get_db() as conn:
+            # Re-check under the write lock: another app may have started
+            # at the same time and already applied this version.
+            conn.execute('BEGIN IMMEDIATE')
+            if version in _applied_versions(conn):
+                continue
+            func(conn)
+            if data_backfill is None:
+                _record(conn, version, description)
+        if data_backfill is not None:
+            rows = data_backfill()
+            if verbose:
+                print(f"  backfilled {rows} rows")
+            with get_db() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                _record(conn, version, description)
+        applied_now.append(version)
+        if verbose:
+            print(f"[OK] Migration {version}: {description}")
+    if applied_now:
+        # Pooled connections cache per-connection setup (e.g. the all_visits
+        # view); reopen them so they see the new schema.
+        close_pools()
+    return applied_now
+
+# ===== MIGRATIONS =====
+
+@migration(1, 'add visits.ai_summary')
+def _add_ai_summary(conn):
+    add_column(conn, 'visits', 'ai_summary', 'TEXT')
+
+@migration(2, 'add visits.completed_at')
+def _add_completed_at(conn):
+    add_column(conn, 'visits', 'completed_at', 'TIMESTAMP')
+
+def _add_epoch_ms_columns(conn):
+    add_column(conn, 'visits', 'created_at_ms', 'INTEGER')
+    add_column(conn, 'visits', 'completed_at_ms', 'INTEGER')
+    add_column(conn, 'visits', 'lease_expires_at_ms', 'INTEGER')
+
+# Numbered migrations carry their own DDL, frozen as it was released;
+# db.schema.INDEXES is the current definition and is only used from
+# migration 10 on
+@migration(3, 'queue and history indexes')
+def _add_queue_indexes(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_waiting_queue
+        ON visits (assigned_tier, risk_score DESC, created_at, id)
+        WHERE status = 'WAITING'
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_patient_history
+        ON visits (patient_phone, status, created_at)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_tier_completed
+        ON visits (assigned_tier, status, completed_at, id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_completed
+        ON visits (completed_at, id)
+        WHERE status = 'COMPLETED'
+    ''')
+
+@migration(4, 'visit claims: claimed_by / claimed_at / lease_expires_at')
+def _add_visit_claims(conn):
+    add_column(conn, 'visits', 'claimed_by', 'INTEGER REFERENCES doctors(id)')
+    add_column(conn, 'visits', 'claimed_at', 'TIMESTAMP')
+    add_column(conn, 'visits', 'lease_expires_at', 'TIMESTAMP')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_in_progress
+        ON visits (lease_expires_at)
+        WHERE status = 'IN_PROGRESS'
+    ''')
+
+@migration(5, 'covering queue-order index for per-visit rank')
+def _covering_queue_index(conn):
+    conn.execute('DROP INDEX IF EXISTS idx_visits_waiting_queue')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_queue_order
+        ON visits (assigned_tier, risk_score DESC, created_at, id, status)
+        WHERE status = 'WAITING'
+    ''')
+
+@migration(6, 'archive database: visits_archive')
+def _create_visits_archive(conn):
+    from db.archive import create_archive_table
+    create_archive_table(conn, indexes=[
+        """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_patient_history
+           ON visits_archive (patient_phone, status, created_at)""",
+        """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_tier_completed
+           ON visits_archive (assigned_tier, status, completed_at, id)""",
+        """CREATE INDEX IF NOT EXISTS archive.idx_visits_archive_completed
+           ON visits_archive (status, completed_at, id)""",
+    ])
+
+# queue_stats keeps one row per tier, maintained by the triggers below so
+# counts never need a scan. A visit "contributes" to its tier's row while it
+# is WAITING or IN_PROGRESS; each trigger removes the OLD contribution and
+# adds the NEW one.
+_QUEUE_STATS_SUBTRACT_OLD = '''
+    UPDATE queue_stats SET
+        waiting_count = waiting_count - (OLD.status = 'WAITING'),
+        in_progress_count = in_progress_count - (OLD.status = 'IN_PROGRESS'),
+        waiting_risk_sum = waiting_risk_sum
+            - (CASE WHEN OLD.status = 'WAITING' THEN COALESCE(OLD.risk_score, 0) ELSE 0 END),
+        waiting_risk_count = waiting_risk_count
+            - (OLD.status = 'WAITING' AND OLD.risk_score IS NOT NULL)
+    WHERE assigned_tier = OLD.assigned_tier;
+'''
+
+_QUEUE_STATS_ADD_NEW = '''
+    INSERT OR IGNORE INTO queue_stats (assigned_tier)
+    SELECT NEW.assigned_tier WHERE NEW.assigned_tier IS NOT NULL;
+    UPDATE queue_stats SET
+        waiting_count = waiting_count + (NEW.status = 'WAITING'),
+        in_progress_count = in_progress_count + (NEW.status = 'IN_PROGRESS'),
+        waiting_risk_sum = waiting_risk_sum
+            + (CASE WHEN NEW.status = 'WAITING' THEN COALESCE(NEW.risk_score, 0) ELSE 0 END),
+        waiting_risk_count = waiting_risk_count
+            + (NEW.status = 'WAITING' AND NEW.risk_score IS NOT NULL),
+        oldest_waiting_at = CASE
+            WHEN NEW.status = 'WAITING'
+                 AND (oldest_waiting_at IS NULL OR NEW.created_at < oldest_waiting_at)
+            THEN NEW.created_at ELSE oldest_waiting_at END
+    WHERE assigned_tier = NEW.assigned_tier;
+'''
+
+# When a WAITING visit leaves a tier the oldest timestamp may have gone with
+# it; MIN(created_at) is a single probe on idx_visits_waiting_since.
+_QUEUE_STATS_REFRESH_OLDEST = '''
+    UPDATE queue_stats SET oldest_waiting_at = (
+        SELECT MIN(created_at) FROM visits
+        WHERE assigned_tier = queue_stats.assigned_tier AND status = 'WAITING'
+    )
+    WHERE assigned_tier = OLD.assigned_tier AND OLD.status = 'WAITING';
+'''
+
+def rebuild_queue_stats(conn):
+    """Recompute queue_stats from visits (used by the migration and for repair)"""
+    conn.execute('DELETE FROM queue_stats')
+    conn.execute('''
+        INSERT INTO queue_stats (assigned_tier, waiting_count, in_progress_count,
+                                 waiting_risk_sum, waiting_risk_count, oldest_waiting_at)
+        SELECT assigned_tier,
+               SUM(status = 'WAITING'),
+               SUM(status = 'IN_PROGRESS'),
+               TOTAL(CASE WHEN status = 'WAITING' THEN risk_score END),
+               COUNT(CASE WHEN status = 'WAITING' THEN risk_score END),
+               MIN(CASE WHEN status = 'WAITING' THEN created_at END)
+        FROM visits
+        WHERE assigned_tier IS NOT NULL AND status IN ('WAITING', 'IN_PROGRESS')
+        GROUP BY assigned_tier
+    ''')
+
+def _create_queue_stats_triggers(conn, subtract_old):
+    """The queue_stats triggers, with `subtract_old` as the per-tier removal step"""
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_stats_insert
+        AFTER INSERT ON visits
+        BEGIN
+            {_QUEUE_STATS_ADD_NEW}
+        END
+    ''')
+    # Lease renewals and note edits do not touch these columns, so they
+    # never fire this trigger
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_stats_update
+        AFTER UPDATE OF status, assigned_tier, risk_score ON visits
+        WHEN OLD.status IS NOT NEW.status
+          OR OLD.assigned_tier IS NOT NEW.assigned_tier
+          OR OLD.risk_score IS NOT NEW.risk_score
+        BEGIN
+            {subtract_old}
+            {_QUEUE_STATS_ADD_NEW}
+            {_QUEUE_STATS_REFRESH_OLDEST}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_stats_delete
+        AFTER DELETE ON visits
+        WHEN OLD.status IN ('WAITING', 'IN_PROGRESS')
+        BEGIN
+            {subtract_old}
+            {_QUEUE_STATS_REFRESH_OLDEST}
+        END
+    ''')
+
+@migration(7, 'queue_stats table maintained by triggers')
+def _create_queue_stats(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS queue_stats (
+            assigned_tier TEXT PRIMARY KEY,
+            waiting_count INTEGER NOT NULL DEFAULT 0,
+            in_progress_count INTEGER NOT NULL DEFAULT 0,
+            waiting_risk_sum REAL NOT NULL DEFAULT 0,
+            waiting_risk_count INTEGER NOT NULL DEFAULT 0,
+            oldest_waiting_at TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_waiting_since
+        ON visits (assigned_tier, created_at)
+        WHERE status = 'WAITING'
+    ''')
+    _create_queue_stats_triggers(conn, _QUEUE_STATS_SUBTRACT_OLD)
+    rebuild_queue_stats(conn)
+
+@migration(8, 'visit_events change feed')
+def _create_visit_events(conn):
+    # AUTOINCREMENT: seq is never reused, even after old events are pruned
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS visit_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            visit_id INTEGER NOT NULL,
+            assigned_tier TEXT,
+            event_type TEXT NOT NULL,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visit_events_tier
+        ON visit_events (assigned_tier, seq)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visit_events_insert
+        AFTER INSERT ON visits
+        BEGIN
+            INSERT INTO visit_events (visit_id, assigned_tier, event_type, status)
+            VALUES (NEW.id, NEW.assigned_tier, 'CREATED', NEW.status);
+        END
+    ''')
+    # A visit moved to another tier also leaves a REMOVED event in the old
+    # tier's feed, so a dashboard following one tier sees it go
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visit_events_update
+        AFTER UPDATE OF status, assigned_tier, risk_score ON visits
+        WHEN OLD.status IS NOT NEW.status
+          OR OLD.assigned_tier IS NOT NEW.assigned_tier
+          OR OLD.risk_score IS NOT NEW.risk_score
+        BEGIN
+            INSERT INTO visit_events (visit_id, assigned_tier, event_type, status)
+            SELECT OLD.id, OLD.assigned_tier, 'REMOVED', NEW.status
+            WHERE OLD.assigned_tier IS NOT NEW.assigned_tier;
+            INSERT INTO visit_events (visit_id, assigned_tier, event_type, status)
+            VALUES (NEW.id, NEW.assigned_tier,
+                    CASE WHEN OLD.status IS NOT NEW.status THEN 'STATUS' ELSE 'UPDATED' END,
+                    NEW.status);
+        END
+    ''')
+    # Archiving deletes COMPLETED visits; those are not queue changes
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visit_events_delete
+        AFTER DELETE ON visits
+        WHEN OLD.status IS NOT 'COMPLETED'
+        BEGIN
+            INSERT INTO visit_events (visit_id, assigned_tier, event_type, status)
+            VALUES (OLD.id, OLD.assigned_tier, 'DELETED', NULL);
+        END
+    ''')
+
+# Full-text index over the free-text visit fields (rowid = visits.id). It
+# keeps its own copy of the text so archived visits stay searchable and
+# snippet() works for them too; like visit_events, the delete trigger
+# ignores COMPLETED visits because those deletes are the archive move.
+def _backfill_visits_fts():
+    def index(conn, rows):
+        conn.executemany('''
+            INSERT OR REPLACE INTO visits_fts (rowid, symptoms_raw, ai_summary, doctor_notes)
+            VALUES (?, ?, ?, ?)
+        ''', [(row['id'], row['symptoms_raw'], row['ai_summary'], row['doctor_notes']) for row in rows])
+
+    total = 0
+    for table in ('main.visits', 'archive.visits_archive'):
+        total += backfill(f'''
+            SELECT id, symptoms_raw, ai_summary, doctor_notes FROM {table} v
+            WHERE NOT EXISTS (SELECT 1 FROM visits_fts WHERE rowid = v.id)
+            ORDER BY id
+        ''', index)
+    return total
+
+@migration(9, 'visits_fts full-text search', backfill=_backfill_visits_fts)
+def _create_visits_fts(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS visits_fts USING fts5(
+            symptoms_raw, ai_summary, doctor_notes,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visits_fts_insert
+        AFTER INSERT ON visits
+        BEGIN
+            INSERT OR REPLACE INTO visits_fts (rowid, symptoms_raw, ai_summary, doctor_notes)
+            VALUES (NEW.id, NEW.symptoms_raw, NEW.ai_summary, NEW.doctor_notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visits_fts_update
+        AFTER UPDATE OF symptoms_raw, ai_summary, doctor_notes ON visits
+        WHEN OLD.symptoms_raw IS NOT NEW.symptoms_raw
+          OR OLD.ai_summary IS NOT NEW.ai_summary
+          OR OLD.doctor_notes IS NOT NEW.doctor_notes
+        BEGIN
+            INSERT OR REPLACE INTO visits_fts (rowid, symptoms_raw, ai_summary, doctor_notes)
+            VALUES (NEW.id, NEW.symptoms_raw, NEW.ai_summary, NEW.doctor_notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_visits_fts_delete
+        AFTER DELETE ON visits
+        WHEN OLD.status IS NOT 'COMPLETED'
+        BEGIN
+            DELETE FROM visits_fts WHERE rowid = OLD.id;
+        END
+    ''')
+
+# Timestamps as integer epoch milliseconds. The *_ms columns carry all
+# ordering and range predicates: integer compares, smaller index entries, and
+# ms resolution so registrations within one second keep their FIFO order.
+# The TIMESTAMP text columns are still written (from the same 'now') for
+# display and for older readers.
+def _backfill_epoch_ms():
+    total = 0
+    for table in ('main.visits', 'archive.visits_archive'):
+        def update(conn, rows, table=table):
+            conn.execute(f'''
+                UPDATE {table} SET
+                    created_at_ms = COALESCE(created_at_ms, {epoch_ms('created_at')}),
+                    completed_at_ms = COALESCE(completed_at_ms, {epoch_ms('completed_at')}),
+                    lease_expires_at_ms = COALESCE(lease_expires_at_ms, {epoch_ms('lease_expires_at')})
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps([row['id'] for row in rows]),))
+
+        # julianday() IS NOT NULL skips unparseable text, which would
+        # otherwise be selected again on every batch
+        total += backfill(f'''
+            SELECT id FROM {table}
+            WHERE (created_at_ms IS NULL AND julianday(created_at) IS NOT NULL)
+               OR (completed_at_ms IS NULL AND julianday(completed_at) IS NOT NULL)
+               OR (lease_expires_at_ms IS NULL AND julianday(lease_expires_at) IS NOT NULL)
+            ORDER BY id
+        ''', update)
+    return total
+
+@migration(10, 'epoch-millisecond timestamp columns', backfill=_backfill_epoch_ms)
+def _add_epoch_ms_timestamps(conn):
+    from db.archive import create_archive_table
+    from db.schema import create_indexes
+    _add_epoch_ms_columns(conn)
+    # Same index names, now on the *_ms columns
+    for name in ('idx_visits_queue_order', 'idx_visits_patient_history',
+                 'idx_visits_tier_completed', 'idx_visits_completed', 'idx_visits_in_progress'):
+        conn.execute(f'DROP INDEX IF EXISTS main.{name}')
+    create_indexes(conn)
+    for name in ('idx_visits_archive_patient_history', 'idx_visits_archive_tier_completed',
+                 'idx_visits_archive_completed'):
+        conn.execute(f'DROP INDEX IF EXISTS archive.{name}')
+    create_archive_table(conn)
+    # Writers that only set the text columns (seed scripts, older code)
+    # still get their *_ms values
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_visits_epoch_ms_insert
+        AFTER INSERT ON visits
+        WHEN NEW.created_at_ms IS NULL
+          OR (NEW.completed_at_ms IS NULL AND NEW.completed_at IS NOT NULL)
+        BEGIN
+            UPDATE visits SET
+                created_at_ms = COALESCE(created_at_ms, {epoch_ms('created_at')}),
+                completed_at_ms = COALESCE(completed_at_ms, {epoch_ms('completed_at')})
+            WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_visits_epoch_ms_completed
+        AFTER UPDATE OF completed_at ON visits
+        WHEN NEW.completed_at_ms IS NULL AND NEW.completed_at IS NOT NULL
+        BEGIN
+            UPDATE visits SET completed_at_ms = {epoch_ms('NEW.completed_at')}
+            WHERE id = NEW.id;
+        END
+    ''')
+
+# Risk-model features as columns (see db/schema.py FEATURE_COLUMNS). New
+# visits get risk_features from create_visit(); older ones are scored here
+# with the same ml.model.risk_features(), taking the age from the year of
+# birth. The backfill also unwraps symptoms_list values that were stored
+# JSON-encoded twice (a JSON string holding the array).
+def _backfill_risk_features():
+    from ml.model import risk_features
+
+    total = 0
+    for table in ('main.visits', 'archive.visits_archive'):
+        def update(conn, rows, table=table):
+            conn.executemany(f'''
+                UPDATE {table} SET
+                    risk_features = ?,
+                    symptoms_list = CASE WHEN json_valid(symptoms_list) AND json_type(symptoms_list) = 'text'
+                                         THEN json_extract(symptoms_list, '$') ELSE symptoms_list END
+                WHERE id = ?
+            ''', [(json.dumps(risk_features(row['symptoms_raw'] or '', row['age'])), row['id'])
+                  for row in rows])
+
+        total += backfill(f'''
+            SELECT v.id, v.symptoms_raw,
+                   CAST(strftime('%Y', v.created_at) AS INTEGER) - p.yob AS age
+            FROM {table} v LEFT JOIN main.patients p ON p.phone_number = v.patient_phone
+            WHERE v.risk_features IS NULL
+            ORDER BY v.id
+        ''', update)
+    return total
+
+@migration(11, 'risk feature columns (JSON1 generated) and indexes', backfill=_backfill_risk_features)
+def _add_risk_feature_columns(conn):
+    from db.schema import add_feature_columns, create_feature_indexes
+    for schema, table in (('main', 'visits'), ('archive', 'visits_archive')):
+        add_feature_columns(conn, schema, table)
+        create_feature_indexes(conn, schema, table)
+
+# Migration 7's triggers add and subtract risk scores on a REAL running sum,
+# so rounding error built up (e.g. -1.45e-13 with nothing waiting). The
+# removal step now resets the sum to exactly 0 when the tier's last scored
+# WAITING visit leaves; the right-hand side still sees the pre-update count.
+_QUEUE_STATS_SUBTRACT_OLD_RESET = '''
+    UPDATE queue_stats SET
+        waiting_count = waiting_count - (OLD.status = 'WAITING'),
+        in_progress_count = in_progress_count - (OLD.status = 'IN_PROGRESS'),
+        waiting_risk_sum = CASE
+            WHEN waiting_risk_count - (OLD.status = 'WAITING' AND OLD.risk_score IS NOT NULL) = 0
+            THEN 0
+            ELSE waiting_risk_sum
+                - (CASE WHEN OLD.status = 'WAITING' THEN COALESCE(OLD.risk_score, 0) ELSE 0 END)
+            END,
+        waiting_risk_count = waiting_risk_count
+            - (OLD.status = 'WAITING' AND OLD.risk_score IS NOT NULL)
+    WHERE assigned_tier = OLD.assigned_tier;
+'''
+
+@migration(12, 'queue_stats: reset waiting_risk_sum when a tier empties')
+def _reset_queue_stats_risk_sum(conn):
+    conn.execute('DROP TRIGGER IF EXISTS trg_queue_stats_update')
+    conn.execute('DROP TRIGGER IF EXISTS trg_queue_stats_delete')
+    _create_queue_stats_triggers(conn, _QUEUE_STATS_SUBTRACT_OLD_RESET)
+    # Clears the drift already accumulated
+    rebuild_queue_stats(conn)
@@ -1,23 +1,104 @@
-from db.connection import get_db
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db.connection import get_db, get_read_db
+from db.retry import retry_on_busy
+
+# Bounded LRU + TTL cache of patient rows keyed by phone number. Writes made
+# through this module update it directly; the TTL bounds how long a change
+# made by another process can go unseen.
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "1024"))
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", "300"))  # seconds
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(phone_number):
+    with _cache_lock:
+        entry = _cache.get(phone_number)
+        if entry is None:
+            return None
+        expires, patient = entry
+        if expires < time.monotonic():
+            del _cache[phone_number]
+            return None
+        _cache.move_to_end(phone_number)
+        return dict(patient)
+
+def _cache_put(patient):
+    if PATIENT_CACHE_SIZE <= 0:
+        return
+    with _cache_lock:
+        _cache[patient['phone_number']] = (time.monotonic() + PATIENT_CACHE_TTL, dict(patient))
+        _cache.move_to_end(patient['phone_number'])
+        while len(_cache) > PATIENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def invalidate_patient(phone_number=None):
+    """Drop one patient (or, with no argument, every patient) from the cache"""
+    with _cache_lock:
+        if phone_number is None:
+            _cache.clear()
+        else:
+            _cache.pop(phone_number, None)
 
 def get_patient_by_phone(phone_number):
-    with get_db() as conn:
+    patient = _cache_get(phone_number)
+    if patient:
+        return patient
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM patients WHERE phone_number = ?', (phone_number,))
         row = cursor.fetchone()
         if row:
-            return dict(row)
+            patient = dict(row)
+            _cache_put(patient)
+            return patient
         return None
 
+@retry_on_busy
 def create_patient(phone_number, yob, name=None):
+    invalidate_patient(phone_number)
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            'INSERT INTO patients (phone_number, yob, name) VALUES (?, ?, ?)',
+            'INSERT INTO patients (phone_number, yob, name) VALUES (?, ?, ?) RETURNING *',
             (phone_number, yob, name)
         )
-        conn.commit()
-        return get_patient_by_phone(phone_number)
+        patient = dict(cursor.fetchone())
+    _cache_put(patient)
+    return patient
+
+@retry_on_busy
+def check_in_patient(phone_number, yob):
+    """Log a patient in, registering them on first visit.
+
+    Returns the patient, or None if the phone number is registered with a
+    different year of birth. One upsert statement: a new number is inserted,
+    a known one is only returned when `yob` matches.
+    """
+    patient = _cache_get(phone_number)
+    if patient and patient['yob'] == yob:
+        return patient
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # The no-op DO UPDATE makes RETURNING yield the existing row, and
+        # its WHERE suppresses it when the year of birth does not match
+        cursor.execute('''
+            INSERT INTO patients (phone_number, yob) VALUES (?, ?)
+            ON CONFLICT (phone_number) DO UPDATE SET yob = excluded.yob
+            WHERE patients.yob = excluded.yob
+            RETURNING *
+        ''', (phone_number, yob))
+        row = cursor.fetchone()
+    if row is None:
+        invalidate_patient(phone_number)
+        return None
+    patient = dict(row)
+    _cache_put(patient)
+    return patient
 
 def verify_patient(phone_number, yob):
     patient = get_patient_by_phone(phone_number)
@@ -25,17 +106,25 @@ def verify_patient(phone_number, yob):
         return patient
     return None
 
+@retry_on_busy
 def update_patient_name(phone_number, name):
+    """Set the patient's name; returns the updated patient (None if unknown)"""
+    invalidate_patient(phone_number)
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            'UPDATE patients SET name = ? WHERE phone_number = ?',
+            'UPDATE patients SET name = ? WHERE phone_number = ? RETURNING *',
             (name, phone_number)
         )
-        conn.commit()
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    patient = dict(row)
+    _cache_put(patient)
+    return patient
 
 def get_all_patients():
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM patients')
         return [dict(row) for row in cursor.fetchall()]
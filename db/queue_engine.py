@@ -0,0 +1,246 @@
+"""
+In-memory per-tier priority queue with write-through to SQLite.
+
+Each tier keeps its WAITING visits in a list sorted by
+(-risk_score, created_at_ms, id), unscored visits last - the same order as
+the ORDER BY in db/visit_repo.py - so peek is O(1) and enqueue, claim, remove and rank
+locate their entry with a binary search. Every mutation is first written
+to `visits` through the repository; memory is only updated once SQLite has
+accepted the change, so the database stays the source of truth.
+
+Other processes (the patient kiosk, other dashboards) write to the same
+file, so `sync()` checks `PRAGMA data_version` on a private connection.
+When nothing changed, a dashboard refresh costs one pragma; otherwise the
+engine reads the visit_events change feed from its last seq and applies
+just those visits. It only falls back to a full rebuild when the feed has
+been pruned past its position or the backlog is large.
+"""
+import bisect
+import threading
+
+from db import visit_repo
+from db.connection import get_connection
+
+def queue_key(visit):
+    # risk_score DESC in SQLite puts NULL after every score, even 0.0
+    score = visit.get('risk_score')
+    return (score is None, -(score or 0.0), visit.get('created_at_ms') or 0, visit['id'])
+
+class TierQueue:
+    """Sorted WAITING visits of one tier"""
+
+    def __init__(self):
+        self._keys = []
+        self._visits = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, visit_id):
+        return visit_id in self._visits
+
+    def add(self, visit):
+        if visit['id'] in self._visits:
+            self.remove(visit['id'])
+        bisect.insort(self._keys, queue_key(visit))
+        self._visits[visit['id']] = visit
+
+    def remove(self, visit_id):
+        visit = self._visits.pop(visit_id, None)
+        if visit is not None:
+            del self._keys[bisect.bisect_left(self._keys, queue_key(visit))]
+        return visit
+
+    def peek(self):
+        return self._visits[self._keys[0][-1]] if self._keys else None
+
+    def rank(self, visit_id):
+        visit = self._visits.get(visit_id)
+        if visit is None:
+            return None
+        return bisect.bisect_left(self._keys, queue_key(visit)) + 1
+
+    def visits(self):
+        return [self._visits[key[-1]] for key in self._keys]
+
+class QueueEngine:
+    # More pending events than this and a rebuild is cheaper than replaying
+    MAX_DELTA_EVENTS = 500
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tiers = {}
+        self._tier_of = {}
+        self._watch_conn = None
+        self._data_version = None
+        self._seq = 0
+        self.rebuild()
+
+    # ----- loading -----
+
+    def _read_data_version(self):
+        if self._watch_conn is None:
+            self._watch_conn = get_connection(read_only=True)
+        return self._watch_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def rebuild(self):
+        """Reload every WAITING visit from the table"""
+        with self._lock:
+            version = self._read_data_version()
+            # Read the feed position first: anything committed while the
+            # table is loading is replayed (idempotently) by the next sync
+            _, seq = visit_repo.get_event_seq_bounds()
+            self._tiers = {}
+            self._tier_of = {}
+            for visit in visit_repo.get_all_waiting_visits():
+                self._add(visit)
+            self._data_version = version
+            self._seq = seq
+
+    def apply_changes(self, events):
+        """Apply change-feed events (see visit_repo.get_changes_since)"""
+        with self._lock:
+            for event in events:
+                self._discard(event['visit_id'])
+                visit = event['visit']
+                if visit is not None and visit['status'] == 'WAITING':
+                    self._add(visit)
+                self._seq = max(self._seq, event['seq'])
+
+    def sync(self):
+        """Catch up with commits made by other connections; True if anything changed"""
+        with self._lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return False
+            oldest, _ = visit_repo.get_event_seq_bounds()
+            if oldest > self._seq + 1:
+                self.rebuild()
+                return True
+            events = visit_repo.get_changes_since(self._seq, limit=self.MAX_DELTA_EVENTS)
+            if len(events) == self.MAX_DELTA_EVENTS:
+                self.rebuild()
+                return True
+            self._data_version = version
+            self.apply_changes(events)
+            return bool(events)
+
+    @property
+    def seq(self):
+        """Last change-feed seq reflected in memory"""
+        return self._seq
+
+    def close(self):
+        with self._lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
+
+    # ----- in-memory helpers -----
+
+    def _add(self, visit):
+        tier = visit['assigned_tier']
+        self._tiers.setdefault(tier, TierQueue()).add(visit)
+        self._tier_of[visit['id']] = tier
+
+    def _discard(self, visit_id):
+        tier = self._tier_of.pop(visit_id, None)
+        if tier is not None:
+            return self._tiers[tier].remove(visit_id)
+        return None
+
+    # ----- reads -----
+
+    def waiting(self, tier):
+        """WAITING visits of a tier in queue order (same shape as get_waiting_visits)"""
+        with self._lock:
+            queue = self._tiers.get(tier)
+            return queue.visits() if queue else []
+
+    def peek(self, tier):
+        with self._lock:
+            queue = self._tiers.get(tier)
+            return queue.peek() if queue else None
+
+    def count(self, tier):
+        with self._lock:
+            queue = self._tiers.get(tier)
+            return len(queue) if queue else 0
+
+    def rank(self, visit_id):
+        """1-based queue position of a WAITING visit, None otherwise"""
+        with self._lock:
+            tier = self._tier_of.get(visit_id)
+            return self._tiers[tier].rank(visit_id) if tier else None
+
+    def ranks(self, visit_ids):
+        with self._lock:
+            ranks = {}
+            for visit_id in visit_ids:
+                rank = self.rank(visit_id)
+                if rank is not None:
+                    ranks[visit_id] = rank
+            return ranks
+
+    # ----- write-through mutations -----
+
+    def enqueue(self, patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level,
+                assigned_tier, ai_summary=None, risk_features=None):
+        """create_visit() and add the new visit to its tier; returns visit_id"""
+        visit_id = visit_repo.create_visit(
+            patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level,
+            assigned_tier, ai_summary, risk_features
+        )
+        rows = visit_repo.get_all_waiting_visits(visit_id)
+        with self._lock:
+            if rows:
+                self._add(rows[0])
+        return visit_id
+
+    def claim(self, visit_id, doctor_id, lease_seconds=None):
+        """Claim a specific visit; None if another doctor already has it"""
+        visit = visit_repo.claim_visit(visit_id, doctor_id, lease_seconds)
+        with self._lock:
+            self._discard(visit_id)
+        return visit
+
+    def claim_next(self, tier, doctor_id, lease_seconds=None):
+        """Claim the head of a tier's queue.
+
+        The head comes from memory; the claim itself is a primary-key UPDATE,
+        so if another process took that visit first we drop it and try the
+        next one.
+        """
+        while True:
+            with self._lock:
+                head = self.peek(tier)
+            if head is None:
+                return None
+            visit = self.claim(head['id'], doctor_id, lease_seconds)
+            if visit is not None:
+                return visit
+
+    def release(self, visit_id, doctor_id):
+        """Hand a claimed visit back to the queue"""
+        visit_repo.release_visit(visit_id, doctor_id)
+        rows = visit_repo.get_all_waiting_visits(visit_id)
+        with self._lock:
+            if rows:
+                self._add(rows[0])
+
+    def complete(self, visit_id, doctor_notes):
+        visit_repo.mark_visit_completed(visit_id, doctor_notes)
+        with self._lock:
+            self._discard(visit_id)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_queue_engine():
+    """Process-wide engine, built from the table on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QueueEngine()
+    return _engine
@@ -0,0 +1,137 @@
+"""
+Retry of write transactions that hit SQLITE_BUSY / SQLITE_LOCKED.
+
+SQLite's busy_timeout (db/connection.py) already waits for the write lock.
+Some failures return immediately instead, for example a pool timeout, a
+lock held across a checkpoint, or a busy_timeout that expired during a
+burst. `@retry_on_busy` re-runs the whole function with jittered
+exponential backoff until RETRY_BUDGET seconds have passed, then raises
+DatabaseBusyError.
+
+Only decorate functions that do all their writing in one `get_db()` block.
+A busy error rolls that transaction back, so running the function again
+is safe.
+
+Every decorated function records its calls, retries and the time spent
+waiting on locks; `get_contention_stats()` reports them per function.
+Most lock waits happen inside busy_timeout, in an attempt that then
+succeeds, so the wait counters include the time of every attempt (failed
+or not) plus the backoff sleeps: an upper bound on the lock wait.
+"""
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+
+RETRY_BUDGET = float(os.getenv("DB_RETRY_BUDGET", "10"))  # seconds, per call
+RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.02"))
+RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "1.0"))
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """A write could not get the database lock within the retry budget"""
+
+    def __init__(self, message, attempts=0, waited=0.0):
+        super().__init__(message)
+        self.attempts = attempts
+        self.waited = waited
+
+def classify_error(exc):
+    """'busy', 'locked' or None for anything that is not lock contention"""
+    if isinstance(exc, DatabaseBusyError):
+        return 'busy'
+    if not isinstance(exc, sqlite3.OperationalError):
+        return None
+    code = getattr(exc, 'sqlite_errorcode', None)
+    if code is not None:
+        code &= 0xff  # extended codes, e.g. SQLITE_BUSY_SNAPSHOT
+        if code == SQLITE_BUSY:
+            return 'busy'
+        if code == SQLITE_LOCKED:
+            return 'locked'
+    message = str(exc).lower()
+    if 'database is locked' in message or 'database is busy' in message:
+        return 'busy'
+    if 'table is locked' in message:
+        return 'locked'
+    if 'connection pool exhausted' in message:
+        return 'busy'
+    return None
+
+def is_busy_error(exc):
+    return classify_error(exc) is not None
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _record(name, attempts, waited, failed):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {
+            'calls': 0, 'retries': 0, 'retried_calls': 0, 'failures': 0,
+            'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+        })
+        stats['calls'] += 1
+        stats['retries'] += attempts - 1
+        stats['retried_calls'] += attempts > 1
+        stats['failures'] += failed
+        stats['wait_ms_total'] += waited * 1000
+        stats['wait_ms_max'] = max(stats['wait_ms_max'], waited * 1000)
+
+def get_contention_stats():
+    """Per-function retry / lock-wait counters since start (or the last reset)"""
+    with _stats_lock:
+        return {
+            name: dict(stats, wait_ms_total=round(stats['wait_ms_total'], 3),
+                       wait_ms_max=round(stats['wait_ms_max'], 3))
+            for name, stats in _stats.items()
+        }
+
+def reset_contention_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def retry_on_busy(func=None, *, budget=None):
+    """Retry `func` on busy/locked errors with jittered exponential backoff"""
+    if func is None:
+        return functools.partial(retry_on_busy, budget=budget)
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        limit = RETRY_BUDGET if budget is None else budget
+        start = time.perf_counter()
+        waited = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exc:
+                waited += time.perf_counter() - attempt_start
+                kind = classify_error(exc)
+                if kind is None or isinstance(exc, DatabaseBusyError):
+                    # Not contention, or a nested call already spent the budget
+                    _record(name, attempt, waited, failed=kind is not None)
+                    raise
+                # "Full jitter": spreads competing writers out
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                if time.perf_counter() - start + delay > limit:
+                    _record(name, attempt, waited, failed=True)
+                    raise DatabaseBusyError(
+                        f"database {kind}: {func.__name__} gave up after {attempt} attempts "
+                        f"({waited:.2f}s waiting)", attempts=attempt, waited=waited
+                    ) from exc
+                time.sleep(delay)
+                waited += delay
+                continue
+            # busy_timeout waits for the lock inside the attempt itself
+            waited += time.perf_counter() - attempt_start
+            _record(name, attempt, waited, failed=False)
+            return result
+
+    return wrapper
@@ -1,4 +1,77 @@
 from db.connection import get_db
+from db.migrations import migrate
+
+# Secondary indexes backing the hot queue/history queries in db/visit_repo.py.
+# Time ordering uses the integer *_ms columns (migration 10), not the text
+# timestamps. These are the current definitions, created by migration 10;
+# a later change to them needs its own migration (migrations 3 and 5 keep
+# the DDL they shipped with).
+# Keep these in step with the queries; test_query_plans.py fails if any of
+# them falls back to a table scan or a temp B-tree sort.
+INDEXES = [
+    # Live queue: partial index holding only WAITING rows, already in queue
+    # order, so next/queue/position queries never touch finished visits.
+    # status is carried along so rank counts are answered from the index alone.
+    """CREATE INDEX IF NOT EXISTS idx_visits_queue_order
+       ON visits (assigned_tier, risk_score DESC, created_at_ms, id, status)
+       WHERE status = 'WAITING'""",
+    # Patient history (previous visits shown to the doctor / AI summary)
+    """CREATE INDEX IF NOT EXISTS idx_visits_patient_history
+       ON visits (patient_phone, status, created_at_ms)""",
+    # Consultation history per tier
+    """CREATE INDEX IF NOT EXISTS idx_visits_tier_completed
+       ON visits (assigned_tier, status, completed_at_ms, id)""",
+    # Consultation history across all tiers
+    """CREATE INDEX IF NOT EXISTS idx_visits_completed
+       ON visits (completed_at_ms, id)
+       WHERE status = 'COMPLETED'""",
+    # Expired-claim sweep and a doctor's current claim
+    """CREATE INDEX IF NOT EXISTS idx_visits_in_progress
+       ON visits (lease_expires_at_ms)
+       WHERE status = 'IN_PROGRESS'""",
+]
+
+def create_indexes(conn):
+    cursor = conn.cursor()
+    for statement in INDEXES:
+        cursor.execute(statement)
+
+# Risk-model features of each visit (ml.model.risk_features), stored as a JSON
+# object in visits.risk_features and exposed as VIRTUAL generated columns so
+# analytics can filter and group on them in SQL (migration 11).
+FEATURE_FLAGS = ['chest_pain', 'breathing_difficulty', 'fever', 'headache', 'emergency_keywords']
+
+FEATURE_COLUMNS = [
+    (name, f"INTEGER GENERATED ALWAYS AS (json_extract(risk_features, '$.{name}')) VIRTUAL")
+    for name in FEATURE_FLAGS + ['age']
+]
+
+def add_feature_columns(conn, schema='main', table='visits'):
+    """Add risk_features and its generated columns to visits or visits_archive"""
+    # Generated columns are hidden from table_info, so check table_xinfo
+    existing = {row[1] for row in conn.execute(f'PRAGMA {schema}.table_xinfo({table})')}
+    if 'risk_features' not in existing:
+        conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN risk_features TEXT')
+    for name, definition in FEATURE_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {name} {definition}')
+
+def create_feature_indexes(conn, schema='main', table='visits'):
+    """Per-flag partial indexes on (created_at_ms, assigned_tier), plus one on age.
+
+    A flag's index only holds the visits with that flag set, so "fever visits
+    per day per tier" reads just those entries and never touches the table.
+    """
+    for name in FEATURE_FLAGS:
+        conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_{name}
+            ON {table} (created_at_ms, assigned_tier)
+            WHERE {name} = 1
+        ''')
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_age
+        ON {table} (age)
+    ''')
 
 def create_tables():
     with get_db() as conn:
@@ -61,7 +134,12 @@ def insert_sample_doctors():
             )
             conn.commit()
 
-def initialize_database():
+def ensure_schema(verbose=False):
+    """Create the baseline tables and apply pending migrations"""
     create_tables()
+    return migrate(verbose=verbose)
+
+def initialize_database():
+    ensure_schema(verbose=True)
     insert_sample_doctors()
     print("[OK] Database initialized successfully!")
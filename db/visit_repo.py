@@ -1,24 +1,165 @@
 import json
-from db.connection import get_db
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 
-def create_visit(patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level, assigned_tier, ai_summary=None):
+from db.connection import get_db, get_read_db
+from db.migrations import NOW_MS
+from db.retry import is_busy_error, retry_on_busy
+from db.schema import FEATURE_FLAGS
+
+# How long a doctor's claim on a visit lasts without being renewed. The
+# dashboard renews it on every refresh; an idle claim goes back to the queue.
+CLAIM_LEASE_SECONDS = int(os.getenv("CLAIM_LEASE_SECONDS", "120"))
+
+# Optional group commit for create_visit: concurrent registrations are
+# queued and written by one thread, up to COALESCE_MAX_ROWS per transaction
+# or whatever arrived within COALESCE_WINDOW_MS. Off by default.
+COALESCE_VISIT_WRITES = os.getenv("VISIT_WRITE_COALESCE", "0") == "1"
+COALESCE_WINDOW_MS = float(os.getenv("VISIT_COALESCE_WINDOW_MS", "5"))
+COALESCE_MAX_ROWS = int(os.getenv("VISIT_COALESCE_MAX_ROWS", "50"))
+
+def _derive_risk_features(conn, patient_phone, symptoms_raw):
+    """risk_features for a caller that did not pass them, scored the way
+    migration 11's backfill does (age from the patient's year of birth)"""
+    from ml.model import risk_features
+    row = conn.execute(
+        "SELECT CAST(strftime('%Y', 'now') AS INTEGER) - yob FROM patients WHERE phone_number = ?",
+        (patient_phone,)
+    ).fetchone()
+    return risk_features(symptoms_raw or '', row[0] if row else None)
+
+def _insert_visit(conn, patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level,
+                  assigned_tier, ai_summary=None, risk_features=None):
+    # Pass symptoms_list as a list; a string is taken to be JSON already
+    if risk_features is None:
+        risk_features = _derive_risk_features(conn, patient_phone, symptoms_raw)
+    symptoms_json = json.dumps(symptoms_list) if isinstance(symptoms_list, list) else symptoms_list
+    features_json = json.dumps(risk_features)
+    # created_at (text, for display) and created_at_ms come from the same 'now'
+    cursor = conn.execute(f'''
+        INSERT INTO visits (patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level, assigned_tier, status, ai_summary, risk_features, created_at_ms)
+        VALUES (?, ?, ?, ?, ?, ?, 'WAITING', ?, ?, {NOW_MS})
+    ''', (patient_phone, symptoms_raw, symptoms_json, risk_score, risk_level, assigned_tier, ai_summary,
+          features_json))
+    return cursor.lastrowid
+
+def create_visit(patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level, assigned_tier,
+                 ai_summary=None, risk_features=None):
+    """Insert a WAITING visit; `risk_features` is the dict from ml.model.risk_features().
+
+    Without `risk_features` they are derived from symptoms_raw and the
+    patient's year of birth, so every visit gets its feature columns.
+    """
+    args = (patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level, assigned_tier,
+            ai_summary, risk_features)
+    if COALESCE_VISIT_WRITES:
+        return get_visit_write_coalescer().submit(args)
+    return _create_visit(*args)
+
+@retry_on_busy
+def _create_visit(*args):
     with get_db() as conn:
-        cursor = conn.cursor()
-        symptoms_json = json.dumps(symptoms_list) if isinstance(symptoms_list, list) else symptoms_list
-        cursor.execute('''
-            INSERT INTO visits (patient_phone, symptoms_raw, symptoms_list, risk_score, risk_level, assigned_tier, status, ai_summary)
-            VALUES (?, ?, ?, ?, ?, ?, 'WAITING', ?)
-        ''', (patient_phone, symptoms_raw, symptoms_json, risk_score, risk_level, assigned_tier, ai_summary))
-        conn.commit()
-        return cursor.lastrowid
+        return _insert_visit(conn, *args)
 
-def get_next_visit_for_tier(tier):
+@retry_on_busy
+def _create_visit_batch(batch):
+    """Insert a batch in one transaction; returns a visit_id or exception per row.
+
+    Each row runs under its own SAVEPOINT, so one bad row is rolled back
+    on its own and reported to its caller without failing the others.
+    """
+    results = []
     with get_db() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for args in batch:
+            conn.execute('SAVEPOINT visit_row')
+            try:
+                results.append(_insert_visit(conn, *args))
+            except sqlite3.Error as e:
+                if is_busy_error(e):
+                    raise
+                conn.execute('ROLLBACK TO visit_row')
+                results.append(e)
+            conn.execute('RELEASE visit_row')
+    return results
+
+class VisitWriteCoalescer:
+    """Single writer thread that group-commits create_visit calls"""
+
+    def __init__(self, window_ms=COALESCE_WINDOW_MS, max_rows=COALESCE_MAX_ROWS):
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._batches = 0
+        self._rows = 0
+        self._thread = threading.Thread(target=self._run, name='visit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, args):
+        """Queue one insert and wait for its visit_id (or its exception)"""
+        future = Future()
+        self._queue.put((args, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = _create_visit_batch([args for args, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            self._batches += 1
+            self._rows += len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self._batches,
+            'rows': self._rows,
+            'rows_per_batch': round(self._rows / self._batches, 2) if self._batches else 0,
+            'queued': self._queue.qsize(),
+        }
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+def get_visit_write_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = VisitWriteCoalescer()
+    return _coalescer
+
+def get_next_visit_for_tier(tier):
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM visits 
             WHERE assigned_tier = ? AND status = 'WAITING'
-            ORDER BY risk_score DESC, created_at ASC
+            ORDER BY risk_score DESC, created_at_ms ASC, id ASC
             LIMIT 1
         ''', (tier,))
         row = cursor.fetchone()
@@ -26,28 +167,299 @@ def get_next_visit_for_tier(tier):
             return dict(row)
         return None
 
+@retry_on_busy
 def mark_visit_completed(visit_id, doctor_notes):
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             UPDATE visits 
-            SET status = 'COMPLETED', doctor_notes = ?, completed_at = CURRENT_TIMESTAMP
+            SET status = 'COMPLETED', doctor_notes = ?,
+                completed_at = CURRENT_TIMESTAMP, completed_at_ms = {NOW_MS},
+                lease_expires_at = NULL, lease_expires_at_ms = NULL
             WHERE id = ?
         ''', (doctor_notes, visit_id))
         conn.commit()
 
-def get_queue_position(assigned_tier):
+def _lease(lease_seconds):
+    """(text modifier, milliseconds) for the two lease_expires_at columns"""
+    seconds = int(lease_seconds or CLAIM_LEASE_SECONDS)
+    return f"+{seconds} seconds", seconds * 1000
+
+def _with_patient(conn, row):
+    """Attach patient name/yob, matching the shape of get_waiting_visits rows"""
+    if row is None:
+        return None
+    visit = dict(row)
+    patient = conn.execute(
+        'SELECT name, yob FROM patients WHERE phone_number = ?', (visit['patient_phone'],)
+    ).fetchone()
+    visit['patient_name'] = patient['name'] if patient else None
+    visit['patient_yob'] = patient['yob'] if patient else None
+    return visit
+
+def _claim_next(conn, tier, doctor_id, lease_seconds):
+    cursor = conn.execute(f'''
+        UPDATE visits
+        SET status = 'IN_PROGRESS', claimed_by = ?, claimed_at = CURRENT_TIMESTAMP,
+            lease_expires_at = datetime('now', ?), lease_expires_at_ms = {NOW_MS} + ?
+        WHERE id = (
+            SELECT id FROM visits
+            WHERE assigned_tier = ? AND status = 'WAITING'
+            ORDER BY risk_score DESC, created_at_ms ASC, id ASC
+            LIMIT 1
+        )
+        RETURNING *
+    ''', (doctor_id, *_lease(lease_seconds), tier))
+    return _with_patient(conn, cursor.fetchone())
+
+@retry_on_busy
+def release_expired_claims():
+    """Put visits whose claim lease ran out back into the WAITING queue"""
+    with get_read_db() as conn:
+        expired = conn.execute(f'''
+            SELECT 1 FROM visits
+            WHERE status = 'IN_PROGRESS' AND lease_expires_at_ms < {NOW_MS}
+            LIMIT 1
+        ''').fetchone()
+    if not expired:
+        return 0
+    with get_db() as conn:
+        cursor = conn.execute(f'''
+            UPDATE visits
+            SET status = 'WAITING', claimed_by = NULL, claimed_at = NULL,
+                lease_expires_at = NULL, lease_expires_at_ms = NULL
+            WHERE status = 'IN_PROGRESS' AND lease_expires_at_ms < {NOW_MS}
+        ''')
+        return cursor.rowcount
+
+@retry_on_busy
+def claim_next_visit(tier, doctor_id, lease_seconds=None):
+    """Atomically take the highest-priority WAITING visit of a tier.
+
+    The visit moves to IN_PROGRESS under a lease held by `doctor_id` and is
+    returned (with patient_name/patient_yob), or None if the queue is empty.
+    Two doctors calling this concurrently never get the same visit.
+    """
+    release_expired_claims()
+    with get_db() as conn:
+        return _claim_next(conn, tier, doctor_id, lease_seconds)
+
+@retry_on_busy
+def claim_visit(visit_id, doctor_id, lease_seconds=None):
+    """Claim a specific WAITING visit; None if another doctor got it first"""
     with get_db() as conn:
+        cursor = conn.execute(f'''
+            UPDATE visits
+            SET status = 'IN_PROGRESS', claimed_by = ?, claimed_at = CURRENT_TIMESTAMP,
+                lease_expires_at = datetime('now', ?), lease_expires_at_ms = {NOW_MS} + ?
+            WHERE id = ? AND status = 'WAITING'
+            RETURNING *
+        ''', (doctor_id, *_lease(lease_seconds), visit_id))
+        return _with_patient(conn, cursor.fetchone())
+
+@retry_on_busy
+def renew_claim(visit_id, doctor_id, lease_seconds=None):
+    """Extend a doctor's lease; False means the claim was lost"""
+    with get_db() as conn:
+        cursor = conn.execute(f'''
+            UPDATE visits
+            SET lease_expires_at = datetime('now', ?), lease_expires_at_ms = {NOW_MS} + ?
+            WHERE id = ? AND claimed_by = ? AND status = 'IN_PROGRESS'
+        ''', (*_lease(lease_seconds), visit_id, doctor_id))
+        return cursor.rowcount == 1
+
+@retry_on_busy
+def release_visit(visit_id, doctor_id):
+    """Give a claimed visit back to the queue (e.g. "Skip for Now")"""
+    with get_db() as conn:
+        conn.execute('''
+            UPDATE visits
+            SET status = 'WAITING', claimed_by = NULL, claimed_at = NULL,
+                lease_expires_at = NULL, lease_expires_at_ms = NULL
+            WHERE id = ? AND claimed_by = ? AND status = 'IN_PROGRESS'
+        ''', (visit_id, doctor_id))
+
+def get_claimed_visit(doctor_id):
+    """The visit a doctor currently holds, if its lease is still valid"""
+    with get_read_db() as conn:
+        cursor = conn.execute(f'''
+            SELECT * FROM visits
+            WHERE status = 'IN_PROGRESS' AND claimed_by = ?
+              AND lease_expires_at_ms >= {NOW_MS}
+            ORDER BY lease_expires_at_ms DESC
+            LIMIT 1
+        ''', (doctor_id,))
+        return _with_patient(conn, cursor.fetchone())
+
+@retry_on_busy
+def complete_and_claim_next(visit_id, doctor_id, doctor_notes, tier, lease_seconds=None):
+    """Complete the current visit and claim the next one in one transaction.
+
+    Returns (completed, next_visit). `completed` is False when the visit
+    had meanwhile been claimed by another doctor (lease expired); nothing
+    is claimed in that case.
+    """
+    release_expired_claims()
+    with get_db() as conn:
+        cursor = conn.execute(f'''
+            UPDATE visits
+            SET status = 'COMPLETED', doctor_notes = ?,
+                completed_at = CURRENT_TIMESTAMP, completed_at_ms = {NOW_MS},
+                lease_expires_at = NULL, lease_expires_at_ms = NULL
+            WHERE id = ? AND (claimed_by = ? OR status = 'WAITING') AND status != 'COMPLETED'
+        ''', (doctor_notes, visit_id, doctor_id))
+        if cursor.rowcount != 1:
+            return False, None
+        return True, _claim_next(conn, tier, doctor_id, lease_seconds)
+
+def get_queue_position(assigned_tier):
+    stats = get_queue_stats(assigned_tier)
+    return stats['waiting_count'] if stats else 0
+
+def _queue_stats_row(row):
+    stats = dict(row)
+    count = stats['waiting_risk_count']
+    stats['avg_waiting_risk'] = stats['waiting_risk_sum'] / count if count else None
+    return stats
+
+def get_queue_stats(tier=None):
+    """Trigger-maintained per-tier counters (see migration 7).
+
+    With a tier: that tier's stats dict, or None if it never had a visit.
+    Without: {tier: stats} for every tier. Keys: waiting_count,
+    in_progress_count, waiting_risk_sum, waiting_risk_count,
+    avg_waiting_risk, oldest_waiting_at.
+    """
+    with get_read_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) as position FROM visits 
-            WHERE assigned_tier = ? AND status = 'WAITING'
-        ''', (assigned_tier,))
-        result = cursor.fetchone()
-        return result['position'] if result else 0
+        if tier:
+            cursor.execute('SELECT * FROM queue_stats WHERE assigned_tier = ?', (tier,))
+            row = cursor.fetchone()
+            return _queue_stats_row(row) if row else None
+        cursor.execute('SELECT * FROM queue_stats ORDER BY assigned_tier')
+        return {row['assigned_tier']: _queue_stats_row(row) for row in cursor.fetchall()}
 
-def verify_doctor(role_tier, pin_code):
+def get_event_seq_bounds():
+    """(oldest, newest) seq still in visit_events.
+
+    When everything has been pruned, oldest is newest + 1 so a reader that
+    is behind can tell it missed events.
+    """
+    with get_read_db() as conn:
+        row = conn.execute('SELECT MIN(seq), MAX(seq) FROM visit_events').fetchone()
+        if row[0] is not None:
+            return (row[0], row[1])
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'visit_events'").fetchone()
+        newest = row[0] if row else 0
+        return (newest + 1, newest)
+
+def get_changes_since(seq, tier=None, limit=500):
+    """Visit change feed: events with seq > `seq`, oldest first.
+
+    Each event carries the visit's current state (with patient_name /
+    patient_yob), or None if the visit no longer exists in the live table.
+    Callers remember the last seq they applied and ask again with it.
+    """
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        query = '''
+            SELECT e.seq, e.visit_id, e.assigned_tier AS event_tier, e.event_type,
+                   e.status AS event_status, e.created_at AS event_at
+            FROM visit_events e
+            WHERE e.seq > ?{}
+            ORDER BY e.seq
+            LIMIT ?
+        '''
+        if tier:
+            cursor.execute(query.format(' AND e.assigned_tier = ?'), (seq, tier, limit))
+        else:
+            cursor.execute(query.format(''), (seq, limit))
+        events = [dict(row) for row in cursor.fetchall()]
+        visit_ids = sorted({event['visit_id'] for event in events})
+        visits = {}
+        if visit_ids:
+            cursor.execute('''
+                SELECT v.*, p.name as patient_name, p.yob as patient_yob
+                FROM visits v
+                LEFT JOIN patients p ON v.patient_phone = p.phone_number
+                WHERE v.id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(visit_ids),))
+            visits = {row['id']: dict(row) for row in cursor.fetchall()}
+        for event in events:
+            event['visit'] = visits.get(event['visit_id'])
+        return events
+
+@retry_on_busy
+def prune_visit_events(older_than_hours=24):
+    """Drop change-feed events older than the retention window"""
+    with get_read_db() as conn:
+        # seq grows with created_at, so walking the primary key from the
+        # oldest event stops at the first one inside the window: it reads
+        # only the events about to be pruned, never the whole table
+        row = conn.execute('''
+            SELECT COALESCE(
+                (SELECT seq FROM visit_events
+                 WHERE created_at >= datetime('now', ?)
+                 ORDER BY seq LIMIT 1),
+                (SELECT MAX(seq) + 1 FROM visit_events))
+        ''', (f'-{int(older_than_hours)} hours',)).fetchone()
+    if row[0] is None:
+        return 0
     with get_db() as conn:
+        cursor = conn.execute('DELETE FROM visit_events WHERE seq < ?', (row[0],))
+        return cursor.rowcount
+
+# Rank = 1 + number of WAITING visits of the same tier ordered ahead of v under
+# the queue order (risk_score DESC, created_at_ms ASC, id ASC). Split into three
+# disjoint ranges so each count is an index seek plus a walk over the covering
+# idx_visits_queue_order entries ahead of v; the table itself is never read.
+# ORDER BY ... DESC sorts a NULL risk_score last, so every scored visit is ahead
+# of an unscored one, and unscored visits tie with each other (IS, not =).
+_RANK_SQL = '''
+    SELECT v.id,
+        1
+        + CASE WHEN v.risk_score IS NULL
+            THEN (SELECT COUNT(*) FROM visits w
+                  WHERE w.assigned_tier = v.assigned_tier AND w.status = 'WAITING'
+                    AND w.risk_score IS NOT NULL)
+            ELSE (SELECT COUNT(*) FROM visits w
+                  WHERE w.assigned_tier = v.assigned_tier AND w.status = 'WAITING'
+                    AND w.risk_score > v.risk_score)
+          END
+        + (SELECT COUNT(*) FROM visits w
+           WHERE w.assigned_tier = v.assigned_tier AND w.status = 'WAITING'
+             AND w.risk_score IS v.risk_score AND w.created_at_ms < v.created_at_ms)
+        + (SELECT COUNT(*) FROM visits w
+           WHERE w.assigned_tier = v.assigned_tier AND w.status = 'WAITING'
+             AND w.risk_score IS v.risk_score AND w.created_at_ms = v.created_at_ms
+             AND w.id < v.id) AS rank
+    FROM visits v
+'''
+
+def get_visit_rank(visit_id):
+    """1-based position of a visit in its tier's queue (None if not WAITING)"""
+    with get_read_db() as conn:
+        cursor = conn.execute(
+            _RANK_SQL + " WHERE v.id = ? AND v.status = 'WAITING'", (visit_id,)
+        )
+        row = cursor.fetchone()
+        return row['rank'] if row else None
+
+def get_visit_ranks(visit_ids):
+    """Ranks for many visits in one query: {visit_id: rank} (WAITING only)"""
+    visit_ids = [int(visit_id) for visit_id in visit_ids]
+    if not visit_ids:
+        return {}
+    with get_read_db() as conn:
+        cursor = conn.execute(
+            _RANK_SQL + '''
+            WHERE v.id IN (SELECT value FROM json_each(?)) AND v.status = 'WAITING'
+            ''', (json.dumps(visit_ids),)
+        )
+        return {row['id']: row['rank'] for row in cursor.fetchall()}
+
+def verify_doctor(role_tier, pin_code):
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM doctors 
@@ -59,22 +471,22 @@ def verify_doctor(role_tier, pin_code):
         return None
 
 def get_visit_by_id(visit_id):
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM visits WHERE id = ?', (visit_id,))
+        cursor.execute('SELECT * FROM all_visits WHERE id = ?', (visit_id,))
         row = cursor.fetchone()
         if row:
             return dict(row)
         return None
 
 def get_previous_visits(patient_phone, limit=5):
-    """Get previous completed visits for a patient"""
-    with get_db() as conn:
+    """Get previous completed visits for a patient (live + archived)"""
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT * FROM visits 
+            SELECT * FROM all_visits 
             WHERE patient_phone = ? AND status = 'COMPLETED'
-            ORDER BY created_at DESC
+            ORDER BY created_at_ms DESC
             LIMIT ?
         ''', (patient_phone, limit))
         rows = cursor.fetchall()
@@ -82,39 +494,178 @@ def get_previous_visits(patient_phone, limit=5):
 
 def get_waiting_visits(tier):
     """Get all waiting visits for a specific tier (for live queue)"""
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT v.*, p.name as patient_name, p.yob as patient_yob
             FROM visits v
             JOIN patients p ON v.patient_phone = p.phone_number
             WHERE v.assigned_tier = ? AND v.status = 'WAITING'
-            ORDER BY v.risk_score DESC, v.created_at ASC
+            ORDER BY v.risk_score DESC, v.created_at_ms ASC, v.id ASC
         ''', (tier,))
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
-def get_completed_visits(tier=None, limit=20):
-    """Get recently completed visits (consultation history)"""
-    with get_db() as conn:
+def get_all_waiting_visits(visit_id=None):
+    """Every WAITING visit across tiers, unordered (or just `visit_id`)"""
+    with get_read_db() as conn:
         cursor = conn.cursor()
-        if tier:
+        if visit_id is not None:
             cursor.execute('''
                 SELECT v.*, p.name as patient_name, p.yob as patient_yob
                 FROM visits v
-                JOIN patients p ON v.patient_phone = p.phone_number
-                WHERE v.assigned_tier = ? AND v.status = 'COMPLETED'
-                ORDER BY v.completed_at DESC, v.id DESC
-                LIMIT ?
-            ''', (tier, limit))
+                LEFT JOIN patients p ON v.patient_phone = p.phone_number
+                WHERE v.id = ? AND v.status = 'WAITING'
+            ''', (visit_id,))
         else:
             cursor.execute('''
                 SELECT v.*, p.name as patient_name, p.yob as patient_yob
                 FROM visits v
-                JOIN patients p ON v.patient_phone = p.phone_number
-                WHERE v.status = 'COMPLETED'
-                ORDER BY v.completed_at DESC, v.id DESC
-                LIMIT ?
-            ''', (limit,))
+                LEFT JOIN patients p ON v.patient_phone = p.phone_number
+                WHERE v.status = 'WAITING'
+            ''')
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
+
+def get_completed_visits(tier=None, limit=20):
+    """Get recently completed visits (consultation history, live + archived)"""
+    visits, _ = get_completed_visits_page(tier, page_size=limit)
+    return visits
+
+def get_completed_visits_page(tier=None, after_cursor=None, page_size=20):
+    """One page of consultation history, newest first.
+
+    Keyset pagination on (completed_at_ms, id): pass the returned cursor back
+    as `after_cursor` to get the next page. Every page is an index seek, so
+    page 1000 costs the same as page 1. Returns (visits, next_cursor);
+    next_cursor is None on the last page.
+    """
+    params = []
+    conditions = ["v.status = 'COMPLETED'"]
+    if tier:
+        conditions.append('v.assigned_tier = ?')
+        params.append(tier)
+    if after_cursor:
+        conditions.append('(v.completed_at_ms, v.id) < (?, ?)')
+        params.extend(after_cursor)
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        # One extra row tells us whether another page exists
+        cursor.execute(f'''
+            SELECT v.*, p.name as patient_name, p.yob as patient_yob
+            FROM all_visits v
+            JOIN patients p ON v.patient_phone = p.phone_number
+            WHERE {' AND '.join(conditions)}
+            ORDER BY v.completed_at_ms DESC, v.id DESC
+            LIMIT ?
+        ''', params + [page_size + 1])
+        visits = [dict(row) for row in cursor.fetchall()]
+    if len(visits) <= page_size:
+        return visits, None
+    visits = visits[:page_size]
+    last = visits[-1]
+    return visits, (last['completed_at_ms'], last['id'])
+
+def _fts_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_visits(query, tier=None, status=None, limit=20, cursor=None):
+    """Full-text search over symptoms, AI summaries and doctor notes.
+
+    Best matches first (bm25). Each visit carries a `snippet` with the
+    matched words wrapped in ** and its `search_rank`. Pass the returned
+    cursor back to get the next page. Returns (visits, next_cursor).
+    """
+    match = _fts_query(query)
+    if match is None:
+        return [], None
+    # all_visits is a UNION ALL view, which SQLite cannot join into by id
+    # without materializing it; so rank in visits_fts alone, then fetch
+    # the candidates by primary key and filter, a batch at a time.
+    batch_size = max(limit * 4, 100)
+    visits = []
+    with get_read_db() as conn:
+        cur = conn.cursor()
+        while len(visits) <= limit:
+            if cursor:
+                cur.execute('''
+                    SELECT rank, rowid FROM visits_fts
+                    WHERE visits_fts MATCH ? AND (rank, rowid) > (?, ?)
+                    ORDER BY rank, rowid
+                    LIMIT ?
+                ''', (match, cursor[0], cursor[1], batch_size))
+            else:
+                cur.execute('''
+                    SELECT rank, rowid FROM visits_fts
+                    WHERE visits_fts MATCH ?
+                    ORDER BY rank, rowid
+                    LIMIT ?
+                ''', (match, batch_size))
+            hits = cur.fetchall()
+            if not hits:
+                break
+            cur.execute('''
+                SELECT v.*, p.name as patient_name, p.yob as patient_yob
+                FROM all_visits v
+                LEFT JOIN patients p ON v.patient_phone = p.phone_number
+                WHERE v.id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps([hit[1] for hit in hits]),))
+            found = {row['id']: dict(row) for row in cur.fetchall()}
+            for rank, visit_id in hits:
+                visit = found.get(visit_id)
+                if visit is None:
+                    continue
+                if (tier and visit['assigned_tier'] != tier) or (status and visit['status'] != status):
+                    continue
+                visit['search_rank'] = rank
+                visits.append(visit)
+                if len(visits) > limit:
+                    break
+            # Same (rank, rowid) order as the keyset predicate
+            cursor = tuple(hits[-1])
+            if len(hits) < batch_size:
+                break
+        next_cursor = None
+        if len(visits) > limit:
+            visits = visits[:limit]
+            next_cursor = (visits[-1]['search_rank'], visits[-1]['id'])
+        if visits:
+            cur.execute('''
+                SELECT rowid, snippet(visits_fts, -1, '**', '**', '…', 16) FROM visits_fts
+                WHERE visits_fts MATCH ? AND rowid IN (SELECT value FROM json_each(?))
+            ''', (match, json.dumps([visit['id'] for visit in visits])))
+            snippets = dict(cur.fetchall())
+            for visit in visits:
+                visit['snippet'] = snippets.get(visit['id'])
+    return visits, next_cursor
+
+def get_feature_counts(feature, days=30, tier=None):
+    """Visits per day and tier with a risk feature flag set, e.g. 'fever'.
+
+    Runs entirely in SQLite on the generated feature columns (live +
+    archived), reading only that flag's partial index. Days are UTC.
+    Returns [{'day', 'assigned_tier', 'visits'}] oldest first.
+    """
+    if feature not in FEATURE_FLAGS:
+        raise ValueError(f"unknown risk feature {feature!r}; expected one of {FEATURE_FLAGS}")
+    params = [int(days) * 86400000]
+    tier_filter = ''
+    if tier:
+        tier_filter = 'AND assigned_tier = ?'
+        params.append(tier)
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT date(created_at_ms / 1000, 'unixepoch') AS day, assigned_tier, COUNT(*) AS visits
+            FROM all_visits
+            WHERE {feature} = 1 AND created_at_ms >= {NOW_MS} - ? {tier_filter}
+            GROUP BY day, assigned_tier
+            ORDER BY day, assigned_tier
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,173 @@
+"""
+Flat-array tree ensemble for the risk model.
+
+`FlatForest.from_sklearn()` flattens a fitted RandomForestRegressor into a
+few contiguous NumPy arrays, one slot per node across all trees:
+
+  feature, threshold   split of each node
+  left, right          global child indices (a leaf points at itself)
+  value                prediction stored at each node
+  roots                index of each tree's root node
+
+`predict()` walks every tree for the whole batch at once: `depth` steps of
+gather + compare + gather on an (n_samples, n_trees) array of node indices,
+then the mean of the leaf values. It uses sklearn's split rule (inputs as
+float32, go left when x <= threshold), so results match
+RandomForestRegressor.predict to float rounding.
+
+The arrays are saved as risk_model.npz next to risk_model.pkl, and ml.model
+serves predictions from it, so the kiosks never import sklearn.
+
+Export an existing model:  python3 ml/forest.py [path/to/risk_model.pkl]
+"""
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+
+class FlatForest:
+    """Tree ensemble as flat arrays; predict() matches RandomForestRegressor"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, depth, n_features,
+                 feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.n_features = int(n_features)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        # children[2 * node] = left, children[2 * node + 1] = right, so one
+        # gather picks the next node once the comparison is known
+        self.children = np.empty(2 * len(left), dtype=np.intp)
+        self.children[0::2] = left
+        self.children[1::2] = right
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            nodes = np.arange(offset, offset + n)
+            leaf = tree.children_left == -1
+            # Leaves loop back to themselves, so every sample can take
+            # exactly `depth` steps whatever the depth of its own leaf
+            lefts.append(np.where(leaf, nodes, tree.children_left + offset))
+            rights.append(np.where(leaf, nodes, tree.children_right + offset))
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            depth = max(depth, tree.max_depth)
+            offset += n
+        names = getattr(model, 'feature_names_in_', None)
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            depth=depth,
+            n_features=model.n_features_in_,
+            feature_names=[str(name) for name in names] if names is not None else None,
+        )
+
+    @classmethod
+    def load(cls, file):
+        """Read a forest saved by save() (a path or a binary file object)"""
+        with np.load(file, allow_pickle=False) as data:
+            return cls(
+                feature=data['feature'].astype(np.intp),
+                threshold=data['threshold'],
+                left=data['left'].astype(np.intp),
+                right=data['right'].astype(np.intp),
+                value=data['value'],
+                roots=data['roots'].astype(np.intp),
+                depth=data['depth'],
+                n_features=data['n_features'],
+                feature_names=data['feature_names'].tolist() if 'feature_names' in data else None,
+            )
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.load(io.BytesIO(data))
+
+    def save(self, path):
+        """Write the arrays to `path` (.npz), replacing any old file atomically"""
+        path = Path(path)
+        arrays = {
+            'feature': self.feature.astype(np.int32),
+            'threshold': self.threshold,
+            'left': self.left.astype(np.int32),
+            'right': self.right.astype(np.int32),
+            'value': self.value,
+            'roots': self.roots.astype(np.int32),
+            'depth': np.int64(self.depth),
+            'n_features': np.int64(self.n_features),
+        }
+        if self.feature_names is not None:
+            arrays['feature_names'] = np.array(self.feature_names)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.value)
+
+    def predict(self, X):
+        """Mean prediction of all trees for each row of X (n_samples, n_features)"""
+        # sklearn validates inputs to float32 before comparing with the
+        # float64 thresholds; doing the same keeps every split identical
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected an array of shape (n, {self.n_features}), got {X.shape}")
+        flat = X.ravel()
+        row_start = (np.arange(len(X)) * self.n_features)[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            go_right = flat.take(row_start + self.feature.take(node)) > self.threshold.take(node)
+            node = self.children.take(2 * node + go_right)
+        return self.value.take(node).mean(axis=1)
+
+def export_forest(model, path):
+    """Flatten a fitted RandomForestRegressor and save it to `path`"""
+    forest = FlatForest.from_sklearn(model)
+    forest.save(path)
+    return forest
+
+if __name__ == "__main__":
+    import pickle
+    import sys
+    import time
+    import warnings
+
+    warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+    model_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / 'risk_model.pkl'
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    forest = export_forest(model, model_path.with_suffix('.npz'))
+    X = np.random.default_rng(0).random((10000, forest.n_features))
+    X[:, 1:] = X[:, 1:] > 0.5
+    diff = np.max(np.abs(forest.predict(X) - model.predict(X)))
+    start = time.perf_counter()
+    for row in X[:1000]:
+        forest.predict(row[None])
+    single_us = (time.perf_counter() - start) * 1000
+    print(f"✅ {forest.n_trees} trees, {forest.node_count} nodes, depth {forest.depth} "
+          f"-> {model_path.with_suffix('.npz')}")
+    print(f"   max |flat - sklearn| = {diff:.2e}, single prediction {single_us:.0f} µs")
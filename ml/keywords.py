@@ -0,0 +1,146 @@
+"""
+Single-pass symptom keyword matching for the risk features.
+
+Every keyword family the risk model uses is compiled at import into one
+regex: a character trie of all keywords (e.g. `he(?:ad(?:ache)?|art(?:\
+attack)?)`), greedy so the longest keyword at a position wins. One scan of
+the lowercased text then finds every keyword:
+  - keywords inside a match ('heart' in 'heart attack', 'hot' in
+    'gunshot') come from a table built with the regex;
+  - the scan resumes after the match, or earlier when the match's tail can
+    start another keyword ('severe' + 'emergency' in "severemergency").
+The result is exactly what one `keyword in text` test per keyword gives,
+which is how the features were originally computed (`match_keywords_naive`).
+
+  match_keywords(text) -> {'chest_pain': ['chest'], 'critical': [...], ...}
+  keyword_flags(text)  -> {'chest_pain': True, 'fever': False, ...}
+
+ml.model.risk_features() is built on keyword_flags(). Long transcripts are
+matched with the per-keyword substring tests instead, which are faster there
+(see SINGLE_PASS_MAX_CHARS and scripts/bench_keyword_matching.py).
+"""
+import re
+
+KEYWORD_FAMILIES = {
+    'chest_pain': ['chest', 'heart', 'cardiac'],
+    'breathing_difficulty': ['breath', 'breathing', 'shortness'],
+    'fever': ['fever', 'temperature', 'hot'],
+    'headache': ['head', 'headache', 'migraine'],
+    # Critical/Emergency keywords that should trigger high risk
+    'critical': [
+        'heart attack', 'stroke', 'unconscious', 'bleeding', 'hemorrhage',
+        'cancer', 'tumor', 'malignant', 'carcinoma', 'oncology',
+        'hiv', 'aids', 'seizure', 'convulsion', 'paralysis', 'paralyzed',
+        'suicide', 'overdose', 'poisoning', 'sepsis', 'septic',
+        'aneurysm', 'embolism', 'thrombosis', 'infarction',
+        'trauma', 'fracture', 'severe', 'critical', 'emergency',
+        'life-threatening', 'code blue', 'cardiac arrest', 'respiratory failure',
+        'organ failure', 'kidney failure', 'liver failure', 'coma',
+        'stabbing', 'gunshot', 'accident', 'collision'
+    ],
+    # Severity indicators
+    'severity': ['severe', 'extreme', 'intense', 'unbearable', 'excruciating',
+                 'massive', 'heavy', 'critical', 'acute', 'sudden'],
+}
+
+def _trie_pattern(words):
+    """Regex alternation factored as a trie; greedy, so the longest word wins"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def render(node):
+        end = '' in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            return (body if len(branches) > 1 else '(?:' + body + ')') + '?'
+        return body
+
+    return render(trie)
+
+_KEYWORDS = sorted({word for words in KEYWORD_FAMILIES.values() for word in words})
+_FAMILIES_OF = {
+    word: [family for family, words in KEYWORD_FAMILIES.items() if word in words]
+    for word in _KEYWORDS
+}
+_KEYWORD_RE = re.compile(_trie_pattern(_KEYWORDS))
+# Keywords that match wherever `word` does because they are part of it
+# ('heart' in 'heart attack', 'hot' in 'gunshot')
+_CONTAINED = {word: [other for other in _KEYWORDS if other in word] for word in _KEYWORDS}
+
+def _resume_offset(word):
+    """Where to continue after `word`: its end, or the first position inside
+    it from which another keyword could begin and run past its end"""
+    for offset in range(1, len(word)):
+        suffix = word[offset:]
+        if any(other.startswith(suffix) and len(other) > len(suffix) for other in _KEYWORDS):
+            return offset
+    return len(word)
+
+_RESUME = {word: _resume_offset(word) for word in _KEYWORDS}
+
+# Up to this length one regex pass is fastest. Beyond it, CPython's C
+# substring search (about 1 ns/char per keyword) beats a Python-level
+# automaton, which runs at sre's ~50 ns/char
+SINGLE_PASS_MAX_CHARS = 256
+
+_FAMILY_WORDS = {family: tuple(words) for family, words in KEYWORD_FAMILIES.items()}
+_POSITION = {family: {word: i for i, word in enumerate(words)}
+             for family, words in KEYWORD_FAMILIES.items()}
+
+def _single_pass(text):
+    """Every keyword occurring in lowercased `text`, in one regex scan"""
+    search = _KEYWORD_RE.search
+    found = set()
+    match = search(text)
+    while match:
+        word = match.group()
+        found.update(_CONTAINED[word])
+        match = search(text, match.start() + _RESUME[word])
+    return found
+
+def match_keywords(text):
+    """Keywords found in `text` (case-insensitive substrings), by family.
+
+    Keywords are listed in KEYWORD_FAMILIES order; families with no match
+    are left out. Same result as match_keywords_naive().
+    """
+    text = text.lower()
+    if len(text) > SINGLE_PASS_MAX_CHARS:
+        return match_keywords_naive(text)
+    hits = {}
+    for word in _single_pass(text):
+        for family in _FAMILIES_OF[word]:
+            hits.setdefault(family, []).append(word)
+    return {
+        family: sorted(hits[family], key=_POSITION[family].__getitem__)
+        for family in KEYWORD_FAMILIES if family in hits
+    }
+
+def keyword_flags(text):
+    """{family: bool} - whether any keyword of each family occurs in `text`"""
+    text = text.lower()
+    if len(text) <= SINGLE_PASS_MAX_CHARS:
+        families = set()
+        for word in _single_pass(text):
+            families.update(_FAMILIES_OF[word])
+        return {family: family in families for family in KEYWORD_FAMILIES}
+    # Stops at each family's first hit
+    contains = text.__contains__
+    return {family: any(map(contains, words)) for family, words in _FAMILY_WORDS.items()}
+
+def match_keywords_naive(text):
+    """One substring scan per keyword (long texts, and the reference for tests)"""
+    text_lower = text.lower()
+    matches = {}
+    for family, words in KEYWORD_FAMILIES.items():
+        hits = [word for word in words if word in text_lower]
+        if hits:
+            matches[family] = hits
+    return matches
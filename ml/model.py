@@ -1,66 +1,233 @@
+import hashlib
+import logging
+import os
 import pickle
 import re
-import pandas as pd
+import threading
+import time
 import warnings
+from datetime import datetime
 from pathlib import Path
 
+from ml.keywords import keyword_flags
+
 # Suppress sklearn version warnings for clean demo output
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
+logger = logging.getLogger(__name__)
+
+# numpy is imported where predictions need it, so risk_features() (also used
+# by the db backfill) can be imported without the ML stack
+FEATURE_NAMES = ['age_normalized', 'chest_pain', 'breathing_difficulty',
+                 'fever', 'headache', 'emergency_keywords']
+
 # Model path
-MODEL_PATH = Path(__file__).parent / 'risk_model.pkl'
+MODEL_PATH = Path(os.getenv("RISK_MODEL_PATH") or Path(__file__).parent / 'risk_model.pkl')
+# Flattened copy of the same forest (ml/forest.py). When it exists predictions
+# come from it, without sklearn; RISK_MODEL_FLAT=0 forces the pickled model.
+FOREST_PATH = MODEL_PATH.with_suffix('.npz')
+USE_FLAT_FOREST = os.getenv("RISK_MODEL_FLAT", "1") == "1"
+# Precomputed score for every table input (ml/risk_table.py); RISK_MODEL_TABLE=0
+# always runs the model
+TABLE_PATH = MODEL_PATH.with_name(MODEL_PATH.stem + '_table.npz')
+USE_RISK_TABLE = os.getenv("RISK_MODEL_TABLE", "1") == "1"
+# How often (seconds) get_model() stats the artifact for a new version
+MODEL_CHECK_INTERVAL = float(os.getenv("RISK_MODEL_CHECK_INTERVAL", "2"))
 
-def load_model():
-    with open(MODEL_PATH, 'rb') as f:
+def load_model(path=MODEL_PATH):
+    """Unpickle the model from disk (uncached; predictions use get_model())"""
+    with open(path, 'rb') as f:
         return pickle.load(f)
 
+class ModelHolder:
+    """Process-wide risk model, loaded on first use and hot-reloaded.
+
+    At most every `check_interval` seconds get() stats the artifact; when its
+    mtime or size changed the file is read and hashed, and a new model is
+    swapped in if the content differs. The model and its info are replaced
+    together in one assignment, so concurrent readers always see a matching
+    pair. If a new artifact fails to load (e.g. half-copied), the current
+    model keeps serving until the file changes again.
+    Deploy by writing the new file next to the old one and os.replace()-ing it.
+    """
+
+    def __init__(self, path=MODEL_PATH, loader=pickle.loads, check_interval=MODEL_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.loader = loader
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = None  # (model, info)
+        self._stamp = None  # (mtime_ns, size) of the file last read
+        self._next_check = 0.0
+
+    def state(self):
+        """(model, info) as one consistent pair; treat info as read-only"""
+        state = self._state
+        if state is not None and time.monotonic() < self._next_check:
+            return state
+        with self._lock:
+            self._refresh(force=False)
+            return self._state
+
+    def get(self):
+        return self.state()[0]
+
+    def info(self):
+        """version (sha256 prefix), path, mtime, loaded_at, load_ms, reloads"""
+        return dict(self.state()[1])
+
+    def reload(self):
+        """Re-read the artifact now; returns the new info"""
+        with self._lock:
+            self._refresh(force=True)
+            return dict(self._state[1])
+
+    def _refresh(self, force):
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._state is None:
+                raise
+            logger.warning("risk model %s is missing; keeping version %s",
+                           self.path, self._state[1]['version'])
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if not force and self._state is not None and stamp == self._stamp:
+            return
+        start = time.perf_counter()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        version = hashlib.sha256(data).hexdigest()[:12]
+        if self._state is not None and version == self._state[1]['version']:
+            # Touched or re-copied, same content
+            self._stamp = stamp
+            return
+        try:
+            model = self.loader(data)
+        except Exception:
+            if self._state is None:
+                raise
+            logger.exception("could not load risk model %s; keeping version %s",
+                             self.path, self._state[1]['version'])
+            # Try again once the file changes (e.g. the copy finishes)
+            self._stamp = stamp
+            return
+        reloads = self._state[1]['reloads'] + 1 if self._state is not None else 0
+        info = {
+            'version': version,
+            'path': str(self.path),
+            'mtime': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
+            'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            'load_ms': round((time.perf_counter() - start) * 1000, 1),
+            'reloads': reloads,
+        }
+        self._state = (model, info)
+        self._stamp = stamp
+        logger.info("loaded risk model %s (version %s) in %.1f ms",
+                    self.path, version, info['load_ms'])
+
+def _load_flat_forest(data):
+    from ml.forest import FlatForest
+    return FlatForest.from_bytes(data)
+
+_holder = ModelHolder()
+_forest_holder = ModelHolder(FOREST_PATH, loader=_load_flat_forest)
+
+def _active_holder():
+    if USE_FLAT_FOREST and FOREST_PATH.exists():
+        return _forest_holder
+    return _holder
+
+def get_model():
+    """The current risk model (loaded once, reloaded when the file changes).
+
+    A FlatForest when risk_model.npz exists, else the pickled sklearn model;
+    both take a (n, 6) feature array in predict().
+    """
+    return _active_holder().get()
+
+def get_model_info():
+    return _active_holder().info()
+
+def reload_model():
+    return _active_holder().reload()
+
+def _load_risk_table(data):
+    from ml.risk_table import RiskTable
+    return RiskTable.from_bytes(data)
+
+_table_holder = ModelHolder(TABLE_PATH, loader=_load_risk_table)
+_table_checks = {}  # (table version, model version) -> table matches the model
+
+def get_risk_table():
+    """The lookup table, or None if there is none or it was built from another model"""
+    if not USE_RISK_TABLE or not TABLE_PATH.exists():
+        return None
+    table, table_info = _table_holder.state()
+    model, model_info = _active_holder().state()
+    key = (table_info['version'], model_info['version'])
+    matches = _table_checks.get(key)
+    if matches is None:
+        matches = _table_checks[key] = table.matches(model)
+        if not matches:
+            logger.warning("risk table %s does not match model %s; running the model instead",
+                           TABLE_PATH, model_info['version'])
+    return table if matches else None
+
+def risk_features(symptoms_text, age):
+    """Named symptom flags plus age, as stored with each visit (visits.risk_features)"""
+    flags = keyword_flags(symptoms_text)
+    return {
+        'age': age,
+        'chest_pain': 1 if flags['chest_pain'] else 0,
+        'breathing_difficulty': 1 if flags['breathing_difficulty'] else 0,
+        'fever': 1 if flags['fever'] else 0,
+        'headache': 1 if flags['headache'] else 0,
+        # Critical conditions or severity indicators
+        'emergency_keywords': 1 if flags['critical'] or flags['severity'] else 0
+    }
+
 def extract_features_from_symptoms(symptoms_text, age):
     """Extract binary features from symptom text"""
-    text_lower = symptoms_text.lower()
-    
-    # Critical/Emergency keywords that should trigger high risk
-    critical_keywords = [
-        'heart attack', 'stroke', 'unconscious', 'bleeding', 'hemorrhage',
-        'cancer', 'tumor', 'malignant', 'carcinoma', 'oncology',
-        'hiv', 'aids', 'seizure', 'convulsion', 'paralysis', 'paralyzed',
-        'suicide', 'overdose', 'poisoning', 'sepsis', 'septic',
-        'aneurysm', 'embolism', 'thrombosis', 'infarction',
-        'trauma', 'fracture', 'severe', 'critical', 'emergency',
-        'life-threatening', 'code blue', 'cardiac arrest', 'respiratory failure',
-        'organ failure', 'kidney failure', 'liver failure', 'coma',
-        'stabbing', 'gunshot', 'accident', 'collision'
+    features = risk_features(symptoms_text, age)
+    return [
+        age / 100, features['chest_pain'], features['breathing_difficulty'],
+        features['fever'], features['headache'], features['emergency_keywords']
     ]
-    
-    # Check for critical conditions
-    has_critical = any(keyword in text_lower for keyword in critical_keywords)
-    
-    # Severity indicators
-    severity_words = ['severe', 'extreme', 'intense', 'unbearable', 'excruciating', 
-                     'massive', 'heavy', 'critical', 'acute', 'sudden']
-    has_severity = any(word in text_lower for word in severity_words)
-    
-    features = {
-        'age_normalized': age / 100,
-        'chest_pain': 1 if any(word in text_lower for word in ['chest', 'heart', 'cardiac']) else 0,
-        'breathing_difficulty': 1 if any(word in text_lower for word in ['breath', 'breathing', 'shortness']) else 0,
-        'fever': 1 if any(word in text_lower for word in ['fever', 'temperature', 'hot']) else 0,
-        'headache': 1 if any(word in text_lower for word in ['head', 'headache', 'migraine']) else 0,
-        'emergency_keywords': 1 if has_critical or has_severity else 0
-    }
-    
-    return list(features.values())
+
+def predict_risk_scores(texts, ages):
+    """Risk scores (clamped to [0, 1]) for many visits with one model.predict call"""
+    import numpy as np
+
+    if len(texts) != len(ages):
+        raise ValueError(f"got {len(texts)} texts but {len(ages)} ages")
+    features = np.empty((len(texts), len(FEATURE_NAMES)), dtype=np.float64)
+    for i, (text, age) in enumerate(zip(texts, ages)):
+        features[i] = extract_features_from_symptoms(text, age)
+    if len(features) == 0:
+        return np.empty(0)
+    table = get_risk_table()
+    if table is not None:
+        scores, hit = table.lookup(features)
+        if hit.all():
+            return scores
+        features = features[~hit]
+    # A bare array, not a DataFrame: the model was fitted with FEATURE_NAMES
+    # in this column order (sklearn's feature-name warning is filtered above)
+    predicted = np.clip(get_model().predict(features), 0.0, 1.0)
+    if table is None:
+        return predicted
+    scores[~hit] = predicted
+    return scores
 
 def predict_risk_score(symptoms_text, age):
-    model = load_model()
-    features = extract_features_from_symptoms(symptoms_text, age)
-    
-    # Use DataFrame to maintain feature names (avoids sklearn warnings)
-    feature_names = ['age_normalized', 'chest_pain', 'breathing_difficulty', 
-                     'fever', 'headache', 'emergency_keywords']
-    features_df = pd.DataFrame([features], columns=feature_names)
-    
-    risk_score = model.predict(features_df)[0]
-    return max(0.0, min(1.0, risk_score))
+    table = get_risk_table()
+    if table is not None:
+        score = table.lookup_one(extract_features_from_symptoms(symptoms_text, age))
+        if score is not None:
+            return score
+    return float(predict_risk_scores([symptoms_text], [age])[0])
 
 # Test function
 if __name__ == "__main__":
@@ -72,4 +239,7 @@ if __name__ == "__main__":
     
     for symptoms, age in test_cases:
         risk = predict_risk_score(symptoms, age)
-        print(f"Symptoms: '{symptoms}', Age: {age} → Risk: {risk:.2f}")
\ No newline at end of file
+        print(f"Symptoms: '{symptoms}', Age: {age} → Risk: {risk:.2f}")
+
+    info = get_model_info()
+    print(f"Model version {info['version']} loaded in {info['load_ms']} ms at {info['loaded_at']}")
\ No newline at end of file
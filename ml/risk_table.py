@@ -0,0 +1,122 @@
+"""
+Precomputed risk score for every input the model can be given.
+
+The model sees age/100 plus five binary symptom flags, and the kiosk form
+takes whole years up to 120, so there are only 121 x 32 = 3,872 distinct
+inputs. `RiskTable.build(model)` scores all of them once; the result is
+saved as risk_model_table.npz next to risk_model.pkl. ml.model then answers
+predict_risk_score() with an array index, and only runs the model for
+feature vectors outside the table (fractional or out-of-range ages).
+
+ml/trainer.py rebuilds and validates the table after every retrain. ml.model
+also checks a table against the model it is serving before using it, so a
+stale table is ignored rather than served.
+
+Rebuild for an existing model:  python3 ml/risk_table.py
+"""
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+
+MAX_AGE = 120
+N_FLAGS = 5
+FLAG_WEIGHTS = 1 << np.arange(N_FLAGS)  # chest_pain = 1 ... emergency_keywords = 16
+
+def grid_features():
+    """All table inputs as a feature array; row age * 32 + flag code"""
+    ages = np.repeat(np.arange(MAX_AGE + 1), 1 << N_FLAGS)
+    codes = np.tile(np.arange(1 << N_FLAGS), MAX_AGE + 1)
+    features = np.empty((len(ages), N_FLAGS + 1), dtype=np.float64)
+    # Same float as extract_features_from_symptoms() computes (age / 100)
+    features[:, 0] = ages / 100
+    features[:, 1:] = (codes[:, None] >> np.arange(N_FLAGS)) & 1
+    return features
+
+class RiskTable:
+    """Clamped risk scores indexed by [age, flag code]"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    @classmethod
+    def build(cls, model):
+        scores = np.clip(model.predict(grid_features()), 0.0, 1.0)
+        return cls(scores.reshape(MAX_AGE + 1, 1 << N_FLAGS))
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            return cls(data['scores'])
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.load(io.BytesIO(data))
+
+    def save(self, path):
+        """Write the table to `path` (.npz), replacing any old file atomically"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, scores=self.scores)
+        os.replace(tmp_path, path)
+        return path
+
+    def max_error(self, model):
+        """Largest difference from the model's own clamped predictions"""
+        expected = np.clip(model.predict(grid_features()), 0.0, 1.0)
+        return float(np.max(np.abs(self.scores.ravel() - expected)))
+
+    def matches(self, model, tolerance=1e-9):
+        return self.scores.shape == (MAX_AGE + 1, 1 << N_FLAGS) and self.max_error(model) <= tolerance
+
+    def lookup_one(self, features):
+        """Score for one feature list, or None if it is not a table input"""
+        age = round(features[0] * 100)
+        if not 0 <= age <= MAX_AGE or age / 100 != features[0]:
+            return None
+        code = 0
+        for bit, flag in enumerate(features[1:]):
+            if flag == 1:
+                code |= 1 << bit
+            elif flag != 0:
+                return None
+        return float(self.scores[age, code])
+
+    def lookup(self, features):
+        """(scores, hit) for a feature array; scores are only valid where hit"""
+        ages = np.rint(features[:, 0] * 100)
+        flags = features[:, 1:]
+        hit = ((ages >= 0) & (ages <= MAX_AGE) & (ages / 100 == features[:, 0])
+               & np.all((flags == 0) | (flags == 1), axis=1))
+        ages = np.where(hit, ages, 0).astype(np.intp)
+        codes = np.where(hit, flags @ FLAG_WEIGHTS, 0).astype(np.intp)
+        return self.scores[ages, codes], hit
+
+def build_risk_table(model, path):
+    """Build, validate and save the table for a trained model"""
+    table = RiskTable.build(model)
+    error = table.max_error(model)
+    if error > 1e-9:
+        raise ValueError(f"risk table does not match the model (max error {error:.2e})")
+    table.save(path)
+    return table
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import warnings
+
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+    from ml.model import TABLE_PATH, extract_features_from_symptoms, get_model
+
+    table = build_risk_table(get_model(), TABLE_PATH)
+    features = extract_features_from_symptoms("chest pain and shortness of breath", 65)
+    start = time.perf_counter()
+    for _ in range(10000):
+        table.lookup_one(features)
+    lookup_us = (time.perf_counter() - start) * 100
+    print(f"✅ {table.scores.size} scores ({table.scores.nbytes} bytes) -> {TABLE_PATH}")
+    print(f"   lookup {lookup_us:.2f} µs")
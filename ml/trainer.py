@@ -1,73 +1,201 @@
-import pandas as pd
+"""
+Train the risk model on synthetic data and publish it for the apps.
+
+The training set is generated with NumPy a chunk at a time into
+preallocated float32 arrays, so memory stays at about 32 bytes per row.
+The forest is fitted on all cores (`n_jobs`). With `chunk_rows` it is grown
+with warm_start instead: each chunk is generated, gets its share of the
+trees, and is dropped. Memory then depends on the chunk size, not on
+`n_samples`.
+
+Every run writes risk_model.pkl, the flattened risk_model.npz
+(ml/forest.py), risk_model_table.npz (ml/risk_table.py) and
+metadata.json to ml/versions/<version>/. The run is then published
+atomically to the paths ml.model serves (ml/risk_model.pkl by default,
+RISK_MODEL_PATH), and the running apps hot-reload it.
+
+Usage: python3 ml/trainer.py [--samples N] [--trees N] [--jobs N]
+                             [--chunk-rows N] [--version V] [--no-publish]
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
 import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-import pickle
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ml.forest import export_forest
+from ml.model import FEATURE_NAMES, MODEL_PATH
+from ml.risk_table import build_risk_table
+
+# The exported forest and score table are checked with plain arrays
+warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+# Share of patients with each symptom flag, in FEATURE_NAMES order
+FLAG_PROBABILITIES = [0.2, 0.15, 0.3, 0.4, 0.05]
+# Risk added by chest pain, breathing difficulty, fever and headache
+FLAG_WEIGHTS = [0.35, 0.25, 0.05, 0.03]
+# Rows generated per NumPy step; bounds the temporaries of the generator
+GENERATE_CHUNK_ROWS = 1_000_000
+TEST_FRACTION = 0.2
+MAX_TEST_ROWS = 200_000
+
+def fill_training_data(X, y, rng):
+    """Fill X (n, 6) and y (n,) with synthetic patients, chunk by chunk"""
+    for start in range(0, len(X), GENERATE_CHUNK_ROWS):
+        stop = min(start + GENERATE_CHUNK_ROWS, len(X))
+        n = stop - start
+        age = rng.integers(18, 80, n)
+        flags = rng.random((n, len(FLAG_PROBABILITIES))) < FLAG_PROBABILITIES
+        score = age / 100 * 0.25 + flags[:, :4] @ FLAG_WEIGHTS + rng.normal(0, 0.05, n)
+        # Emergency keywords dominate the risk score: 0.85-1.0
+        emergency = flags[:, 4]
+        score[emergency] = 0.85 + rng.uniform(0, 0.15, np.count_nonzero(emergency))
+        np.clip(score, 0.0, 1.0, out=y[start:stop])
+        X[start:stop, 0] = age / 100
+        X[start:stop, 1:] = flags
+    return X, y
+
+def generate_training_arrays(n_samples, rng):
+    """(X float32 (n, 6), y float64 (n,)); float32 is what the trees split on"""
+    X = np.empty((n_samples, len(FEATURE_NAMES)), dtype=np.float32)
+    y = np.empty(n_samples, dtype=np.float64)
+    return fill_training_data(X, y, rng)
 
 # Generate synthetic training data
-def generate_training_data(n_samples=1000):
-    np.random.seed(42)
-    data = []
-    
-    for _ in range(n_samples):
-        age = np.random.randint(18, 80)
-        
-        # Symptom features (binary)
-        chest_pain = np.random.choice([0, 1], p=[0.8, 0.2])
-        breathing_difficulty = np.random.choice([0, 1], p=[0.85, 0.15])
-        fever = np.random.choice([0, 1], p=[0.7, 0.3])
-        headache = np.random.choice([0, 1], p=[0.6, 0.4])
-        emergency_keywords = np.random.choice([0, 1], p=[0.95, 0.05])
-        
-        # Calculate risk score based on features
-        # Emergency keywords should dominate the risk score
-        if emergency_keywords == 1:
-            risk_score = 0.85 + np.random.uniform(0, 0.15)  # 0.85-1.0 for emergencies
-        else:
-            risk_score = 0.0
-            risk_score += age / 100 * 0.25  # Age factor (0-0.25)
-            risk_score += chest_pain * 0.35  # Chest pain (0-0.35)
-            risk_score += breathing_difficulty * 0.25  # Breathing (0-0.25)
-            risk_score += fever * 0.05  # Fever (0-0.05)
-            risk_score += headache * 0.03  # Headache (0-0.03)
-            
-            # Add some noise
-            risk_score += np.random.normal(0, 0.05)
-        
-        risk_score = max(0.0, min(1.0, risk_score))  # Clamp to [0,1]
-        
-        data.append({
-            'age_normalized': age / 100,
-            'chest_pain': chest_pain,
-            'breathing_difficulty': breathing_difficulty,
-            'fever': fever,
-            'headache': headache,
-            'emergency_keywords': emergency_keywords,
-            'risk_score': risk_score
-        })
-    
-    return pd.DataFrame(data)
+def generate_training_data(n_samples=1000, seed=42):
+    X, y = generate_training_arrays(n_samples, np.random.default_rng(seed))
+    df = pd.DataFrame(X, columns=FEATURE_NAMES)
+    df['risk_score'] = y
+    return df
+
+def _frame(X):
+    # Fitting on named columns keeps feature_names_in_ on the model
+    return pd.DataFrame(X, columns=FEATURE_NAMES, copy=False)
+
+def fit_forest(n_samples, rng, n_estimators=100, n_jobs=-1, chunk_rows=None, seed=42):
+    """Fit the forest on `n_samples` generated rows; returns the model"""
+    model = RandomForestRegressor(n_estimators=n_estimators, n_jobs=n_jobs, random_state=seed)
+    if not chunk_rows or chunk_rows >= n_samples:
+        X, y = generate_training_arrays(n_samples, rng)
+        return model.fit(_frame(X), y)
+
+    n_chunks = -(-n_samples // chunk_rows)
+    if n_chunks > n_estimators:
+        raise ValueError(f"{n_chunks} chunks need at least as many trees (got {n_estimators})")
+    model.set_params(warm_start=True, n_estimators=0)
+    X = np.empty((chunk_rows, len(FEATURE_NAMES)), dtype=np.float32)
+    y = np.empty(chunk_rows, dtype=np.float64)
+    for i in range(n_chunks):
+        rows = min(chunk_rows, n_samples - i * chunk_rows)
+        fill_training_data(X[:rows], y[:rows], rng)
+        # Trees spread evenly over the chunks, the remainder on the first ones
+        trees = n_estimators // n_chunks + (i < n_estimators % n_chunks)
+        model.set_params(n_estimators=model.n_estimators + trees)
+        model.fit(_frame(X[:rows]), y[:rows])
+    return model.set_params(warm_start=False)
+
+def artifact_paths(model_path):
+    """The pickle, flat forest and score table, named the way ml.model finds them"""
+    model_path = Path(model_path)
+    return {
+        'model': model_path,
+        'forest': model_path.with_suffix('.npz'),
+        'table': model_path.with_name(model_path.stem + '_table.npz'),
+    }
+
+def _publish(source, dest):
+    """Copy next to `dest`, then os.replace() it, as ModelHolder expects"""
+    tmp_path = dest.with_name(dest.name + '.tmp')
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, dest)
 
 # Train model
-def train_model():
-    df = generate_training_data()
-    
-    features = ['age_normalized', 'chest_pain', 'breathing_difficulty', 
-                'fever', 'headache', 'emergency_keywords']
-    X = df[features]
-    y = df['risk_score']
-    
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    # Save model
-    with open('risk_model.pkl', 'wb') as f:
+def train_model(n_samples=1000, n_estimators=100, n_jobs=-1, chunk_rows=None, seed=42,
+                model_path=MODEL_PATH, version=None, publish=True):
+    """Train, write ml/versions/<version>/ and (by default) publish it; returns metadata"""
+    model_path = Path(model_path)
+    version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+    version_dir = model_path.parent / 'versions' / version
+    if version_dir.exists():
+        raise FileExistsError(f"model version {version} already exists at {version_dir}")
+
+    rng = np.random.default_rng(seed)
+    # Test rows come from the same stream, ahead of the training rows
+    n_test = min(max(1, int(n_samples * TEST_FRACTION)), MAX_TEST_ROWS)
+    X_test, y_test = generate_training_arrays(n_test, rng)
+    n_train = n_samples - n_test
+
+    start = time.perf_counter()
+    model = fit_forest(n_train, rng, n_estimators, n_jobs, chunk_rows, seed)
+    fit_seconds = time.perf_counter() - start
+
+    # Save model, plus the flattened copy and the score table the apps use
+    version_dir.mkdir(parents=True)
+    paths = artifact_paths(version_dir / model_path.name)
+    with open(paths['model'], 'wb') as f:
         pickle.dump(model, f)
-    
-    print(f"✅ Model trained! Accuracy: {model.score(X_test, y_test):.2f}")
-    return model
+    export_forest(model, paths['forest'])
+    build_risk_table(model, paths['table'])
+
+    metadata = {
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'n_samples': n_samples,
+        'n_train': n_train,
+        'n_test': n_test,
+        'n_estimators': len(model.estimators_),
+        'chunk_rows': chunk_rows,
+        'seed': seed,
+        'fit_seconds': round(fit_seconds, 1),
+        'r2_test': round(float(model.score(_frame(X_test), y_test)), 4),
+    }
+    with open(version_dir / 'metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    if publish:
+        # The table last: ml.model ignores a table that does not match the
+        # model it is serving, so a reload between copies never serves it stale
+        for name, dest in artifact_paths(model_path).items():
+            _publish(paths[name], dest)
+    metadata['path'] = str(version_dir)
+    return metadata
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=1000,
+                        help="synthetic rows, test rows included (default 1000)")
+    parser.add_argument('--trees', type=int, default=100, help="n_estimators (default 100)")
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="parallel jobs for fitting (default -1, all cores)")
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help="grow the forest with warm_start over chunks of this many rows")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--model-path', type=Path, default=MODEL_PATH,
+                        help=f"where the apps load the model (default {MODEL_PATH})")
+    parser.add_argument('--version', help="version name (default: timestamp)")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="only write ml/versions/<version>/")
+    args = parser.parse_args()
+
+    try:
+        result = train_model(args.samples, args.trees, args.jobs, args.chunk_rows, args.seed,
+                             args.model_path, args.version, publish=not args.no_publish)
+    except Exception as e:
+        print(f"❌ Training failed: {e}")
+        raise
+    print(f"✅ Model {result['version']} trained on {result['n_train']:,} rows "
+          f"in {result['fit_seconds']} s, test R² {result['r2_test']:.2f} -> {result['path']}")
+    if not args.no_publish:
+        print(f"   published to {args.model_path}")
@@ -2,7 +2,6 @@ import streamlit as st
 import os
 from ai_processing import transcribe_audio, extract_patient_data, extract_from_text
 from predict_risk import predict_risk_score
-import json
 from datetime import datetime
 from db.patient_repo import get_patient_by_phone, create_patient, verify_patient, update_patient_name
 from db.visit_repo import create_visit, get_queue_position
@@ -571,7 +570,7 @@ def show_voice_input_screen():
                     visit_id = create_visit(
                         st.session_state.patient_phone,
                         symptoms,
-                        json.dumps(symptoms_list),
+                        symptoms_list,
                         float(risk_score),
                         risk_level,
                         assigned_tier
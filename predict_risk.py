@@ -1,15 +1,12 @@
-import pickle
 import re
 import pandas as pd
 import warnings
 
+from ml.model import get_model
+
 # Suppress sklearn version warnings for clean demo output
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
-def load_model():
-    with open('risk_model.pkl', 'rb') as f:
-        return pickle.load(f)
-
 def extract_features_from_symptoms(symptoms_text, age):
     """Extract binary features from symptom text"""
     text_lower = symptoms_text.lower()
@@ -26,7 +23,8 @@ def extract_features_from_symptoms(symptoms_text, age):
     return list(features.values())
 
 def predict_risk_score(symptoms_text, age):
-    model = load_model()
+    # Shared, cached model (ml/risk_model.pkl), not a per-call unpickle
+    model = get_model()
     features = extract_features_from_symptoms(symptoms_text, age)
     
     # Use DataFrame to maintain feature names (avoids sklearn warnings)
@@ -1,28 +1,19 @@
 #!/usr/bin/env python3
 """
 Add completed_at column to existing visits table
+
+Kept for compatibility: the column is now added by migration 2 in
+db/migrations.py, so this just applies pending migrations.
 """
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from db.connection import get_db
+from db.schema import ensure_schema
 
 def migrate():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Check if column exists
-        cursor.execute("PRAGMA table_info(visits)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'completed_at' not in columns:
-            print("Adding completed_at column...")
-            cursor.execute("ALTER TABLE visits ADD COLUMN completed_at TIMESTAMP")
-            conn.commit()
-            print("✅ Migration completed!")
-        else:
-            print("✅ completed_at column already exists.")
+    ensure_schema(verbose=True)
+    print("✅ Migration completed!")
 
 if __name__ == "__main__":
     migrate()
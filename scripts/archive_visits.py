@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Move old COMPLETED visits from the live database into the archive file.
+Safe to run while the kiosks and dashboards are up (e.g. nightly from cron).
+
+Usage: python3 scripts/archive_visits.py [--days N]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db.schema import ensure_schema
+from db.archive import ARCHIVE_AFTER_DAYS, archive_completed_visits, get_archive_stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"archive visits completed more than N days ago (default {ARCHIVE_AFTER_DAYS})")
+    args = parser.parse_args()
+
+    ensure_schema()
+    moved = archive_completed_visits(older_than_days=args.days)
+    stats = get_archive_stats()
+    print(f"✅ Archived {moved} visits "
+          f"({stats['live_visits']} live, {stats['archived_visits']} archived)")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Online backup of the live database (and its archive) without stopping the kiosks.
+
+Usage: python3 scripts/backup_db.py [--keep N]     rotating backup in backups/
+       python3 scripts/backup_db.py --snapshot     refresh the read-only reporting snapshot
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db.backup import BACKUP_KEEP, create_backup, create_reporting_snapshot
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keep', type=int, default=BACKUP_KEEP,
+                        help=f"number of rotating backups to keep (default {BACKUP_KEEP})")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="write the reporting snapshot instead of a rotating backup")
+    args = parser.parse_args()
+
+    try:
+        if args.snapshot:
+            result = create_reporting_snapshot()
+        else:
+            result = create_backup(keep=args.keep)
+    except Exception as e:
+        print(f"❌ Backup failed: {e}")
+        raise
+    print(f"✅ Backed up to {result['path']} "
+          f"({result['bytes'] / 1024 / 1024:.1f} MB in {result['seconds']} s)")
+    for path in result.get('removed', []):
+        print(f"   removed old backup {path}")
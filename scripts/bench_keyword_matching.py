@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark symptom keyword matching: the original per-keyword `in` scans vs
+risk_features() / keyword_flags() and the single-pass match_keywords(),
+on kiosk-length inputs and long multi-paragraph transcripts.
+
+Usage: python3 scripts/bench_keyword_matching.py [--repeat N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ml.keywords import KEYWORD_FAMILIES, match_keywords, match_keywords_naive
+from ml.model import risk_features
+
+PARAGRAPHS = [
+    "Patient is a 58 year old man who says the trouble started three days ago after "
+    "climbing stairs at his daughter's house. He felt tightness in the chest that went "
+    "away after resting, and has been more tired than usual since then.",
+    "He reports a mild cough at night and occasional shortness of breath when lying flat. "
+    "No fever at home. He takes tablets for blood pressure and sometimes forgets the "
+    "evening dose. His father had a heart problem in his sixties.",
+    "Appetite is normal, sleep is poor because of the cough. He walks to the market "
+    "every morning and has not noticed swelling in the legs. He does not smoke now but "
+    "smoked for twenty years and stopped after his retirement.",
+]
+
+SAMPLES = {
+    'kiosk, 4 words': "mild cough and cold",
+    'kiosk, 1 line': "chest pain and shortness of breath since this morning, feeling dizzy",
+    'transcript, 3 paragraphs': '\n\n'.join(PARAGRAPHS),
+    'transcript, 30 paragraphs': '\n\n'.join(PARAGRAPHS * 10),
+    'transcript, 300 paragraphs': '\n\n'.join(PARAGRAPHS * 100),
+}
+
+def original_risk_features(symptoms_text, age):
+    """The features as computed before ml/keywords.py: one any() per family"""
+    text_lower = symptoms_text.lower()
+    has_critical = any(keyword in text_lower for keyword in KEYWORD_FAMILIES['critical'])
+    has_severity = any(word in text_lower for word in KEYWORD_FAMILIES['severity'])
+    return {
+        'age': age,
+        'chest_pain': 1 if any(word in text_lower for word in KEYWORD_FAMILIES['chest_pain']) else 0,
+        'breathing_difficulty': 1 if any(word in text_lower for word in KEYWORD_FAMILIES['breathing_difficulty']) else 0,
+        'fever': 1 if any(word in text_lower for word in KEYWORD_FAMILIES['fever']) else 0,
+        'headache': 1 if any(word in text_lower for word in KEYWORD_FAMILIES['headache']) else 0,
+        'emergency_keywords': 1 if has_critical or has_severity else 0
+    }
+
+def per_call_us(func, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200000,
+                        help="characters' worth of calls per measurement (default 200000)")
+    args = parser.parse_args()
+
+    print(f"{'input':<28} {'chars':>6} | {'features: original':>18} {'new':>8} | "
+          f"{'report: naive':>13} {'single pass':>11}   (µs per call)")
+    for label, text in SAMPLES.items():
+        assert risk_features(text, 50) == original_risk_features(text, 50)
+        assert ({k: set(v) for k, v in match_keywords(text).items()}
+                == {k: set(v) for k, v in match_keywords_naive(text).items()})
+        repeat = max(20, args.repeat // len(text))
+        timings = [
+            per_call_us(lambda t: original_risk_features(t, 50), text, repeat),
+            per_call_us(lambda t: risk_features(t, 50), text, repeat),
+            per_call_us(match_keywords_naive, text, repeat),
+            per_call_us(match_keywords, text, repeat),
+        ]
+        print(f"{label:<28} {len(text):>6} | {timings[0]:>18.1f} {timings[1]:>8.1f} | "
+              f"{timings[2]:>13.1f} {timings[3]:>11.1f}")
+    print("✅ features and matched keywords identical on every input")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark risk scoring: per-call DataFrame (old path) vs predict_risk_score()
+vs one predict_risk_scores() batch, reported as cost per item.
+
+Usage: python3 scripts/bench_risk_scoring.py [--sizes 1 100 10000] [--loop-cap N]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pandas as pd
+
+from ml.model import (FEATURE_NAMES, MODEL_PATH, extract_features_from_symptoms, get_model,
+                      get_model_info, load_model, predict_risk_score, predict_risk_scores)
+
+SYMPTOMS = [
+    "chest pain and shortness of breath", "mild headache", "fever and cough for two days",
+    "severe abdominal pain", "heart attack symptoms", "sore throat", "migraine with nausea",
+    "high temperature and body ache", "sudden dizziness", "back pain after lifting",
+]
+
+sklearn_model = None
+
+def dataframe_score(text, age):
+    """The original implementation: a DataFrame and a sklearn predict per call"""
+    features_df = pd.DataFrame([extract_features_from_symptoms(text, age)], columns=FEATURE_NAMES)
+    return max(0.0, min(1.0, sklearn_model.predict(features_df)[0]))
+
+def per_item_us(func, texts, ages, cap):
+    """Time func over (at most `cap` of) the items; microseconds per item"""
+    n = min(len(texts), cap)
+    start = time.perf_counter()
+    for text, age in zip(texts[:n], ages[:n]):
+        func(text, age)
+    return (time.perf_counter() - start) / n * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--loop-cap', type=int, default=300,
+                        help="score at most N items one at a time per size (default 300)")
+    args = parser.parse_args()
+
+    if not MODEL_PATH.exists():
+        print(f"❌ No model at {MODEL_PATH}; train one first (python3 ml/trainer.py)")
+        sys.exit(1)
+    rng = random.Random(42)
+    sklearn_model = load_model()
+    get_model()  # load once, outside the timings
+    predict_risk_scores(SYMPTOMS[:1], [40])
+    print(f"Serving {get_model_info()['path']}")
+
+    print(f"{'items':>7} {'DataFrame/call':>15} {'single call':>12} {'batch':>10}   (µs per item)")
+    for size in args.sizes:
+        texts = [rng.choice(SYMPTOMS) for _ in range(size)]
+        ages = [rng.randint(18, 85) for _ in range(size)]
+        old = per_item_us(dataframe_score, texts, ages, args.loop_cap)
+        single = per_item_us(predict_risk_score, texts, ages, args.loop_cap)
+        start = time.perf_counter()
+        scores = predict_risk_scores(texts, ages)
+        batch = (time.perf_counter() - start) / size * 1e6
+        assert abs(scores[0] - dataframe_score(texts[0], ages[0])) < 1e-9
+        print(f"{size:>7} {old:>15.1f} {single:>12.1f} {batch:>10.1f}   "
+              f"({old / batch:.0f}x vs DataFrame/call)")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Run one SQLite maintenance pass (optimize, incremental vacuum, WAL checkpoint).
+Safe to run while the kiosks and dashboards are up (e.g. hourly from cron).
+
+Usage: python3 scripts/maintain_db.py [--vacuum-pages N] [--enable-auto-vacuum]
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db.schema import ensure_schema
+from db.maintenance import VACUUM_STEP_PAGES, enable_incremental_vacuum, run_maintenance
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vacuum-pages', type=int, default=VACUUM_STEP_PAGES,
+                        help=f"free at most N pages this run (default {VACUUM_STEP_PAGES})")
+    parser.add_argument('--enable-auto-vacuum', action='store_true',
+                        help="switch an existing database to auto_vacuum=INCREMENTAL "
+                             "(full VACUUM, blocks writers while it runs)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    ensure_schema()
+    if args.enable_auto_vacuum:
+        print(f"✅ auto_vacuum = {enable_incremental_vacuum()}")
+    report = run_maintenance(vacuum_pages=args.vacuum_pages)
+    print(f"✅ Maintenance done in {report['total_ms']} ms")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the flat-array risk model (ml/forest.py), the
+precomputed score table (ml/risk_table.py) and the trainer (ml/trainer.py).
+
+A forest trained the way ml/trainer.py trains it is flattened, saved and
+reloaded; its predictions must match RandomForestRegressor.predict to 1e-9.
+Skipped when scikit-learn is not installed (the kiosks do not need it).
+
+Run with:  python -m pytest -q test_flat_forest.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from sklearn.ensemble import RandomForestRegressor
+
+from ml.forest import FlatForest, export_forest
+from ml.model import FEATURE_NAMES, extract_features_from_symptoms
+from ml.risk_table import RiskTable, build_risk_table
+from ml.trainer import artifact_paths, generate_training_data, train_model
+
+def training_data(n, seed):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.integers(18, 80, n) / 100,
+        rng.random((n, 5)) < [0.2, 0.15, 0.3, 0.4, 0.05],
+    ]).astype(np.float64)
+    y = np.clip(0.25 * X[:, 0] + X[:, 1:] @ [0.35, 0.25, 0.05, 0.03, 0.6]
+                + rng.normal(0, 0.05, n), 0, 1)
+    return X, y
+
+@pytest.fixture(scope='module')
+def model():
+    X, y = training_data(800, seed=42)
+    return RandomForestRegressor(n_estimators=100, random_state=42).fit(X, y)
+
+@pytest.fixture(scope='module')
+def forest(model, tmp_path_factory):
+    path = tmp_path_factory.mktemp('forest') / 'risk_model.npz'
+    export_forest(model, path)
+    return FlatForest.load(path)
+
+def test_matches_sklearn_on_random_inputs(model, forest):
+    X, _ = training_data(5000, seed=7)
+    # Continuous ages too, not just the 0.01 grid the model was trained on
+    X[:, 0] = np.random.default_rng(8).random(len(X))
+    assert np.max(np.abs(forest.predict(X) - model.predict(X))) < 1e-9
+
+def test_matches_sklearn_on_split_thresholds(model, forest):
+    """Inputs exactly on (and just around) every age split take the same branch"""
+    thresholds = np.unique(forest.threshold[forest.feature == 0])
+    ages = np.concatenate([thresholds, np.nextafter(thresholds, 0), np.nextafter(thresholds, 1)])
+    X = np.zeros((len(ages), len(FEATURE_NAMES)))
+    X[:, 0] = ages
+    X[::2, 1] = 1
+    assert np.max(np.abs(forest.predict(X) - model.predict(X))) < 1e-9
+
+def test_single_row_and_symptom_features(model, forest):
+    for text, age in [("chest pain and shortness of breath", 65), ("mild headache", 25),
+                      ("heart attack symptoms", 70), ("fever", 40)]:
+        X = np.array([extract_features_from_symptoms(text, age)])
+        assert abs(forest.predict(X)[0] - model.predict(X)[0]) < 1e-9
+
+def test_rejects_wrong_shape(forest):
+    with pytest.raises(ValueError):
+        forest.predict(np.zeros((3, 5)))
+
+def test_risk_table_matches_model(model, forest, tmp_path):
+    build_risk_table(model, tmp_path / 'table.npz')
+    table = RiskTable.load(tmp_path / 'table.npz')
+    assert table.matches(forest)
+    texts = ["", "chest pain", "heart attack with fever and breathing trouble", "severe headache"]
+    for age in range(0, 121, 7):
+        for text in texts:
+            features = extract_features_from_symptoms(text, age)
+            expected = np.clip(model.predict(np.array([features])), 0, 1)[0]
+            assert abs(table.lookup_one(features) - expected) < 1e-9
+
+def test_risk_table_misses_outside_the_grid(model):
+    table = RiskTable.build(model)
+    for age in (45.5, 121, -1):
+        assert table.lookup_one(extract_features_from_symptoms("fever", age)) is None
+    features = np.array([extract_features_from_symptoms("fever", age) for age in (30, 30.5, 200)])
+    _, hit = table.lookup(features)
+    assert hit.tolist() == [True, False, False]
+    assert not RiskTable(np.zeros_like(table.scores)).matches(model)
+
+def test_trainer_writes_and_publishes_versions(tmp_path):
+    model_path = tmp_path / 'risk_model.pkl'
+    result = train_model(2000, n_estimators=9, n_jobs=1, chunk_rows=500, model_path=model_path,
+                         version='v1')
+    assert (result['n_train'], result['n_test'], result['n_estimators']) == (1600, 400, 9)
+    for name, path in artifact_paths(model_path).items():
+        assert path.read_bytes() == (tmp_path / 'versions' / 'v1' / path.name).read_bytes(), name
+    forest = FlatForest.load(artifact_paths(model_path)['forest'])
+    assert RiskTable.load(artifact_paths(model_path)['table']).matches(forest)
+    with pytest.raises(FileExistsError):
+        train_model(100, n_estimators=2, model_path=model_path, version='v1')
+
+def test_generated_data_is_seeded():
+    df = generate_training_data(5000)
+    assert df.equals(generate_training_data(5000))
+    assert list(df.columns[:-1]) == FEATURE_NAMES and df['risk_score'].between(0, 1).all()
+    assert abs(df['emergency_keywords'].mean() - 0.05) < 0.02
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression tests for the hot queue/history queries.
+
+Every statement issued by the repository functions below is captured and
+run through EXPLAIN QUERY PLAN; the test fails if any table is read with a
+full scan or if SQLite needs a temp B-tree to sort the result.
+
+Run with:  python -m pytest -q test_query_plans.py
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import db.connection as connection
+from db.schema import ensure_schema
+from db import visit_repo
+from db.archive import archive_completed_visits
+
+@pytest.fixture
+def traced_db(tmp_path, monkeypatch):
+    """Fresh database whose pooled connections record every statement"""
+    statements = []
+    open_connection = connection.get_connection
+
+    def traced_connection(*args, **kwargs):
+        conn = open_connection(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    connection.close_pools()
+    monkeypatch.setattr(connection, 'DB_PATH', str(tmp_path / 'plans.db'))
+    monkeypatch.setattr(connection, 'get_connection', traced_connection)
+    ensure_schema()
+    seed_visits()
+    statements.clear()
+    yield statements
+    connection.close_pools()
+
+def seed_visits():
+    with connection.get_db() as conn:
+        conn.executemany(
+            'INSERT INTO patients (phone_number, yob, name) VALUES (?, ?, ?)',
+            [(f'90000000{i:02d}', 1950 + i, f'Patient {i}') for i in range(20)]
+        )
+        rows = []
+        for i in range(200):
+            tier = 'SENIOR' if i % 3 == 0 else 'JUNIOR'
+            status = 'WAITING' if i % 4 == 0 else 'COMPLETED'
+            features = json.dumps({'age': 20 + i % 60, 'fever': int(i % 7 == 0), 'headache': int(i % 5 == 0)})
+            rows.append((f'90000000{i % 20:02d}', f'symptoms {i}', (i % 10) / 10, tier, status, features,
+                         status, i % 90))
+        conn.executemany('''
+            INSERT INTO visits (patient_phone, symptoms_raw, risk_score, assigned_tier, status, risk_features, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, CASE WHEN ? = 'COMPLETED' THEN datetime('now', -? || ' days') END)
+        ''', rows)
+    # Older history lives in the archive, so the plans cover both sides of all_visits
+    archive_completed_visits()
+    with connection.get_db() as conn:
+        conn.execute('ANALYZE')
+
+def query_plan(sql):
+    with connection.get_read_db() as conn:
+        return [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+def assert_indexed(statements):
+    queries = [s for s in statements if s.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE'))]
+    assert queries, "no query was captured"
+    for sql in queries:
+        plan = query_plan(sql)
+        for detail in plan:
+            assert not (detail.startswith('SCAN') and 'INDEX' not in detail), \
+                f"full table scan:\n{sql}\n{plan}"
+            assert 'TEMP B-TREE' not in detail, f"temp sort:\n{sql}\n{plan}"
+
+# Keyset cursor (completed_at_ms, id) in the middle of the seeded history
+MID_CURSOR = (int((time.time() - 45 * 86400) * 1000), 50)
+
+HOT_QUERIES = {
+    'get_waiting_visits': lambda: visit_repo.get_waiting_visits('SENIOR'),
+    'get_next_visit_for_tier': lambda: visit_repo.get_next_visit_for_tier('JUNIOR'),
+    'get_queue_position': lambda: visit_repo.get_queue_position('SENIOR'),
+    'get_previous_visits': lambda: visit_repo.get_previous_visits('9000000003', limit=5),
+    'get_completed_visits (tier)': lambda: visit_repo.get_completed_visits(tier='SENIOR'),
+    'get_completed_visits (all)': lambda: visit_repo.get_completed_visits(),
+    'get_completed_visits_page (tier)': lambda: visit_repo.get_completed_visits_page(
+        'SENIOR', after_cursor=MID_CURSOR, page_size=10),
+    'get_completed_visits_page (all)': lambda: visit_repo.get_completed_visits_page(
+        after_cursor=MID_CURSOR, page_size=10),
+    'claim_next_visit': lambda: visit_repo.claim_next_visit('SENIOR', doctor_id=1),
+    'get_claimed_visit': lambda: visit_repo.get_claimed_visit(doctor_id=1),
+    'get_visit_rank': lambda: visit_repo.get_visit_rank(visit_id=4),
+    'get_visit_ranks': lambda: visit_repo.get_visit_ranks([4, 8, 12, 13]),
+    'get_queue_stats': lambda: visit_repo.get_queue_stats('SENIOR'),
+    'get_changes_since': lambda: visit_repo.get_changes_since(150, tier='SENIOR'),
+    'get_changes_since (all)': lambda: visit_repo.get_changes_since(150),
+}
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(traced_db, name):
+    HOT_QUERIES[name]()
+    assert_indexed(traced_db)
+
+def test_completed_pages_follow_integer_cursor(traced_db):
+    """Pages walk (completed_at_ms, id) downwards across live and archived visits"""
+    with connection.get_read_db() as conn:
+        expected = [row[0] for row in conn.execute(
+            "SELECT id FROM all_visits WHERE status = 'COMPLETED' ORDER BY completed_at_ms DESC, id DESC")]
+    seen, cursor = [], None
+    while True:
+        page, cursor = visit_repo.get_completed_visits_page(after_cursor=cursor, page_size=7)
+        seen += [visit['id'] for visit in page]
+        if cursor is None:
+            break
+        assert isinstance(cursor[0], int)
+    assert seen == expected
+    page, _ = visit_repo.get_completed_visits_page(after_cursor=MID_CURSOR, page_size=500)
+    assert page and all((v['completed_at_ms'], v['id']) < MID_CURSOR for v in page)
+    assert len(page) < len(expected)
+
+def test_feature_counts_use_feature_index(traced_db):
+    """Symptom analytics read the flag's partial index on both sides of all_visits.
+
+    GROUP BY day needs a small sort over the matching rows only, so this
+    checks for the indexes rather than for the absence of a temp B-tree.
+    """
+    visit_repo.get_feature_counts('fever', tier='SENIOR')
+    sql = next(s for s in traced_db if 'fever = 1' in s)
+    plan = query_plan(sql)
+    assert any('idx_visits_fever' in detail for detail in plan), plan
+    assert any('idx_visits_archive_fever' in detail for detail in plan), plan
+    for detail in plan:
+        assert not (detail.startswith('SCAN') and detail != 'SCAN all_visits'
+                    and 'INDEX' not in detail), f"full table scan:\n{sql}\n{plan}"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Behavior tests for @retry_on_busy and the contention counters (db/retry.py).
+
+Run with:  python -m pytest -q test_retry.py
+"""
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db import connection, retry
+from db.connection import get_db
+from db.retry import DatabaseBusyError, get_contention_stats, retry_on_busy
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(retry, 'RETRY_BASE_DELAY', 0.001)
+    monkeypatch.setattr(retry, 'RETRY_MAX_DELAY', 0.005)
+    retry.reset_contention_stats()
+    yield
+    retry.reset_contention_stats()
+
+def flaky(failures, error=None):
+    """A function failing `failures` times with `error` before it succeeds"""
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or sqlite3.OperationalError('database is locked')
+        return 'written'
+
+    return write, calls
+
+def stats_for(func):
+    return get_contention_stats()[f'{func.__module__}.{func.__qualname__}']
+
+def test_retries_until_the_write_succeeds():
+    write, calls = flaky(3)
+    wrapped = retry_on_busy(write)
+    assert wrapped() == 'written'
+    assert len(calls) == 4
+    stats = stats_for(write)
+    assert (stats['calls'], stats['retries'], stats['retried_calls'], stats['failures']) == (1, 3, 1, 0)
+    assert stats['wait_ms_total'] > 0
+
+def test_raises_busy_error_once_the_budget_is_spent():
+    write, calls = flaky(10 ** 6)
+    wrapped = retry_on_busy(write, budget=0.05)
+    with pytest.raises(DatabaseBusyError) as raised:
+        wrapped()
+    assert raised.value.attempts == len(calls) > 1
+    assert isinstance(raised.value.__cause__, sqlite3.OperationalError)
+    stats = stats_for(write)
+    assert (stats['calls'], stats['retries'], stats['failures']) == (1, len(calls) - 1, 1)
+    # The budget bounds the time spent waiting
+    assert raised.value.waited < 0.1
+
+def test_other_errors_are_not_retried():
+    write, calls = flaky(1, sqlite3.OperationalError('no such table: visits'))
+    with pytest.raises(sqlite3.OperationalError, match='no such table'):
+        retry_on_busy(write)()
+    assert len(calls) == 1
+    stats = stats_for(write)
+    assert (stats['calls'], stats['retries'], stats['failures']) == (1, 0, 0)
+
+def test_retries_a_real_lock_held_by_another_connection(tmp_path):
+    path = str(tmp_path / 'busy.db')
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute('PRAGMA journal_mode = WAL')
+    holder.execute('CREATE TABLE t (x)')
+    holder.execute('BEGIN IMMEDIATE')
+    released = threading.Timer(0.1, holder.execute, args=('COMMIT',))
+
+    @retry_on_busy(budget=5)
+    def insert():
+        conn = sqlite3.connect(path, timeout=0, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO t VALUES (1)')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    released.start()
+    insert()
+    released.join()
+    assert holder.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+    holder.close()
+    stats = stats_for(insert)
+    assert stats['retries'] > 0 and stats['failures'] == 0
+    assert stats['wait_ms_max'] >= 50
+
+@pytest.fixture
+def pooled_db(tmp_path, monkeypatch):
+    """A fresh database behind the get_db() pool, with one table `t`"""
+    path = str(tmp_path / 'pooled.db')
+    connection.close_pools()
+    monkeypatch.setattr(connection, 'DB_PATH', path)
+    with get_db() as conn:
+        conn.execute('CREATE TABLE t (x)')
+    yield path
+    connection.close_pools()
+
+def hold_write_lock(path, seconds):
+    """Take the write lock on another connection; released after `seconds`"""
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute('BEGIN IMMEDIATE')
+
+    def release():
+        holder.execute('COMMIT')
+        holder.close()
+
+    timer = threading.Timer(seconds, release)
+    timer.start()
+    return timer
+
+@retry_on_busy(budget=5)
+def pooled_insert():
+    with get_db() as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+
+def test_counts_the_busy_timeout_wait_of_a_pooled_write(pooled_db):
+    # busy_timeout absorbs the lock: no retry, but the wait is still counted
+    timer = hold_write_lock(pooled_db, 0.3)
+    pooled_insert()
+    timer.join()
+    stats = stats_for(pooled_insert)
+    assert (stats['calls'], stats['retries'], stats['failures']) == (1, 0, 0)
+    assert stats['wait_ms_total'] >= 250
+
+def test_retries_a_pooled_write_once_busy_timeout_expires(pooled_db, monkeypatch):
+    monkeypatch.setitem(connection.PRAGMAS, 'busy_timeout', 0)
+    connection.close_pools()
+    # Open the pooled connection before the lock is taken, as in the apps
+    with get_db() as conn:
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 0
+    timer = hold_write_lock(pooled_db, 0.1)
+    pooled_insert()
+    timer.join()
+    with get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+    stats = stats_for(pooled_insert)
+    assert stats['retries'] > 0 and stats['failures'] == 0
+    assert stats['wait_ms_total'] >= 50
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the symptom keyword matcher (ml/keywords.py).
+
+match_keywords() and keyword_flags() must agree exactly with one substring
+test per keyword, the way the risk features were originally computed, on
+both the single-pass path (short text) and the long-text path.
+
+Run with:  python -m pytest -q test_symptom_keywords.py
+"""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ml.keywords import (KEYWORD_FAMILIES, SINGLE_PASS_MAX_CHARS, keyword_flags, match_keywords,
+                         match_keywords_naive)
+from ml.model import risk_features
+
+KEYWORDS = sorted({word for words in KEYWORD_FAMILIES.values() for word in words})
+# Overlaps and near-misses: keyword inside a word, tail of one keyword
+# starting the next, a prefix of a longer keyword, spacing and case
+TRICKY = ['gunshot', 'photo', 'headed', 'heartache', 'severemergency', 'heart  attack',
+          'HEART ATTACK', 'Fever', 'acutest', 'comatose', 'breathe', 'xhivx', 'sepsi']
+
+def original_features(text, age):
+    """risk_features() as it was computed before ml/keywords.py"""
+    text_lower = text.lower()
+    has = {family: any(word in text_lower for word in words)
+           for family, words in KEYWORD_FAMILIES.items()}
+    return {
+        'age': age,
+        'chest_pain': int(has['chest_pain']),
+        'breathing_difficulty': int(has['breathing_difficulty']),
+        'fever': int(has['fever']),
+        'headache': int(has['headache']),
+        'emergency_keywords': int(has['critical'] or has['severity']),
+    }
+
+def random_texts(count, max_parts, seed):
+    rng = random.Random(seed)
+    filler = 'abcdefghijklmnopqrstuvwxyz -'
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, max_parts)):
+            choice = rng.random()
+            if choice < 0.3:
+                parts.append(rng.choice(KEYWORDS))
+            elif choice < 0.4:
+                parts.append(rng.choice(TRICKY))
+            else:
+                parts.append(''.join(rng.choice(filler) for _ in range(rng.randint(1, 8))))
+        yield rng.choice([' ', '', ', ']).join(parts)
+
+@pytest.mark.parametrize('max_parts', [6, 200])
+def test_matches_naive_scan(max_parts):
+    lengths = set()
+    for text in random_texts(3000 if max_parts < 50 else 300, max_parts, seed=max_parts):
+        lengths.add(len(text) > SINGLE_PASS_MAX_CHARS)
+        assert match_keywords(text) == match_keywords_naive(text), text
+        naive = match_keywords_naive(text)
+        assert keyword_flags(text) == {family: family in naive for family in KEYWORD_FAMILIES}, text
+        assert risk_features(text, 40) == original_features(text, 40), text
+    assert lengths == ({False} if max_parts < 50 else {False, True})
+
+@pytest.mark.parametrize('text', TRICKY + KEYWORDS)
+def test_tricky_inputs(text):
+    assert match_keywords(text) == match_keywords_naive(text)
+    assert risk_features(text, 40) == original_features(text, 40)
+
+def test_reports_matched_keywords():
+    assert match_keywords("Sudden chest pain after a heart attack last year") == {
+        'chest_pain': ['chest', 'heart'],
+        'critical': ['heart attack'],
+        'severity': ['sudden'],
+    }
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Behavior tests for db/visit_repo.py on a fresh database.
+
+Run with:  python -m pytest -q test_visit_repo.py
+"""
+import json
+import random
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import db.connection as connection
+from db.schema import ensure_schema
+from db import visit_repo
+from db.archive import archive_completed_visits
+from db.migrations import rebuild_queue_stats
+from db.queue_engine import QueueEngine
+from ml.model import risk_features
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    connection.close_pools()
+    monkeypatch.setattr(connection, 'DB_PATH', str(tmp_path / 'visits.db'))
+    ensure_schema()
+    with connection.get_db() as conn:
+        conn.executemany(
+            'INSERT INTO patients (phone_number, yob, name) VALUES (?, ?, ?)',
+            [(f'90000000{i:02d}', 1950 + i, f'Patient {i}') for i in range(10)]
+        )
+    yield tmp_path
+    connection.close_pools()
+
+def add_visits(count, tier='JUNIOR'):
+    return [
+        visit_repo.create_visit(f'90000000{i % 10:02d}', f'symptoms {i}', [], (i % 10) / 10, 'LOW', tier)
+        for i in range(count)
+    ]
+
+def test_concurrent_claims_never_share_a_visit(fresh_db):
+    visit_ids = add_visits(120)
+    claimed = {doctor_id: [] for doctor_id in range(1, 9)}
+    start = threading.Barrier(len(claimed))
+
+    def doctor(doctor_id):
+        start.wait()
+        while (visit := visit_repo.claim_next_visit('JUNIOR', doctor_id)) is not None:
+            assert visit['claimed_by'] == doctor_id and visit['status'] == 'IN_PROGRESS'
+            claimed[doctor_id].append(visit['id'])
+
+    threads = [threading.Thread(target=doctor, args=(doctor_id,)) for doctor_id in claimed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    all_claims = [visit_id for ids in claimed.values() for visit_id in ids]
+    assert sorted(all_claims) == sorted(visit_ids)
+    with connection.get_read_db() as conn:
+        rows = conn.execute("SELECT id, claimed_by FROM visits WHERE status = 'IN_PROGRESS'").fetchall()
+    assert {row['id']: row['claimed_by'] for row in rows} == {
+        visit_id: doctor_id for doctor_id, ids in claimed.items() for visit_id in ids
+    }
+
+def test_expired_lease_is_requeued(fresh_db):
+    add_visits(3)
+    visit = visit_repo.claim_next_visit('JUNIOR', doctor_id=1)
+    assert visit_repo.get_claimed_visit(1)['id'] == visit['id']
+    assert visit_repo.release_expired_claims() == 0
+    with connection.get_db() as conn:
+        conn.execute('UPDATE visits SET lease_expires_at_ms = lease_expires_at_ms - 10 * 60 * 1000 WHERE id = ?',
+                     (visit['id'],))
+    assert visit_repo.get_claimed_visit(1) is None
+    assert visit_repo.release_expired_claims() == 1
+    requeued = visit_repo.get_visit_by_id(visit['id'])
+    assert (requeued['status'], requeued['claimed_by'], requeued['lease_expires_at_ms']) == ('WAITING', None, None)
+    # Back at the head of the queue, for the next doctor; the old holder lost it
+    assert visit_repo.claim_next_visit('JUNIOR', doctor_id=2)['id'] == visit['id']
+    assert not visit_repo.renew_claim(visit['id'], doctor_id=1)
+
+def queue_stats_rows():
+    with connection.get_read_db() as conn:
+        return {row['assigned_tier']: dict(row)
+                for row in conn.execute('SELECT * FROM queue_stats ORDER BY assigned_tier')}
+
+def test_queue_stats_triggers_match_rebuild(fresh_db):
+    rng = random.Random(9)
+    claimed = []
+    for step in range(600):
+        action = rng.random()
+        tier = rng.choice(['JUNIOR', 'SENIOR'])
+        if action < 0.4:
+            # Some visits have no score yet; they count as waiting but not in the risk average
+            risk_score = None if rng.random() < 0.1 else round(rng.random(), 3)
+            visit_repo.create_visit('9000000001', f'visit {step}', [], risk_score, 'LOW', tier)
+        elif action < 0.6 or not claimed:
+            visit = visit_repo.claim_next_visit(tier, doctor_id=1)
+            if visit:
+                claimed.append(visit['id'])
+        elif action < 0.75:
+            visit_repo.release_visit(claimed.pop(rng.randrange(len(claimed))), doctor_id=1)
+        elif action < 0.9:
+            visit_repo.mark_visit_completed(claimed.pop(rng.randrange(len(claimed))), 'done')
+        else:
+            completed, visit = visit_repo.complete_and_claim_next(
+                claimed.pop(rng.randrange(len(claimed))), 1, 'done', tier)
+            assert completed
+            if visit:
+                claimed.append(visit['id'])
+    maintained = queue_stats_rows()
+    with connection.get_db() as conn:
+        rebuild_queue_stats(conn)
+    rebuilt = queue_stats_rows()
+    assert maintained.keys() == rebuilt.keys()
+    for tier, row in rebuilt.items():
+        assert maintained[tier]['waiting_risk_sum'] == pytest.approx(row['waiting_risk_sum'], abs=1e-9)
+        assert {**maintained[tier], 'waiting_risk_sum': None} == {**row, 'waiting_risk_sum': None}
+
+def test_queue_stats_risk_sum_is_exactly_zero_when_empty(fresh_db):
+    rng = random.Random(3)
+    for i in range(200):
+        visit_repo.create_visit('9000000001', f'visit {i}', [], rng.random(), 'LOW', 'JUNIOR')
+    while visit_repo.claim_next_visit('JUNIOR', doctor_id=1):
+        pass
+    stats = visit_repo.get_queue_stats('JUNIOR')
+    assert (stats['waiting_count'], stats['in_progress_count']) == (0, 200)
+    assert queue_stats_rows()['JUNIOR']['waiting_risk_sum'] == 0
+
+def test_coalesced_batch_fails_only_the_bad_row(fresh_db, monkeypatch):
+    coalescer = visit_repo.VisitWriteCoalescer(window_ms=500, max_rows=50)
+    monkeypatch.setattr(visit_repo, 'COALESCE_VISIT_WRITES', True)
+    monkeypatch.setattr(visit_repo, '_coalescer', coalescer)
+    results = {}
+    start = threading.Barrier(8)
+
+    def register(i):
+        start.wait()
+        # symptoms_raw is NOT NULL, so caller 5's row fails inside the batch
+        symptoms = None if i == 5 else f'symptoms {i}'
+        try:
+            results[i] = visit_repo.create_visit('9000000001', symptoms, [], 0.5, 'LOW', 'JUNIOR')
+        except sqlite3.Error as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=register, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert coalescer.stats()['batches'] == 1 and coalescer.stats()['rows'] == 8
+    assert isinstance(results.pop(5), sqlite3.IntegrityError)
+    assert all(isinstance(visit_id, int) for visit_id in results.values())
+    with connection.get_read_db() as conn:
+        stored = {row['id']: row['symptoms_raw'] for row in conn.execute('SELECT id, symptoms_raw FROM visits')}
+    assert stored == {visit_id: f'symptoms {i}' for i, visit_id in results.items()}
+
+def seed_search_visits(count, seed):
+    """Visits of varied length (so bm25 ranks differ), a fifth mentioning a knee
+    injury; completed ones older than the archive cutoff go to the archive"""
+    rng = random.Random(seed)
+    filler = ['pain', 'swelling', 'fever', 'cough', 'fall', 'sports', 'walking', 'stairs']
+    rows = []
+    for i in range(count):
+        words = rng.choices(filler, k=rng.randint(1, 30))
+        if i % 5 == 0:
+            words.insert(rng.randrange(len(words) + 1), 'knee injury')
+        # WAITING is rare, so a (tier, WAITING) filter is sparse among the top hits
+        status = 'WAITING' if rng.random() < 0.05 else 'COMPLETED'
+        rows.append((f'90000000{i % 10:02d}', ' '.join(words), rng.choice(['JUNIOR', 'SENIOR']),
+                     status, status, f'-{rng.randint(1, 60)} days'))
+    with connection.get_db() as conn:
+        conn.executemany('''
+            INSERT INTO visits (patient_phone, symptoms_raw, risk_score, assigned_tier, status, completed_at)
+            VALUES (?, ?, 0.5, ?, ?, CASE WHEN ? = 'COMPLETED' THEN datetime('now', ?) END)
+        ''', rows)
+    archive_completed_visits()
+
+def fts_order(match, tier=None, status=None):
+    """Matching visit ids in search order, from a plain join of visits_fts and all_visits"""
+    with connection.get_read_db() as conn:
+        return [row[0] for row in conn.execute('''
+            SELECT v.id FROM visits_fts f JOIN all_visits v ON v.id = f.rowid
+            WHERE visits_fts MATCH ? AND (? IS NULL OR v.assigned_tier = ?)
+              AND (? IS NULL OR v.status = ?)
+            ORDER BY f.rank, f.rowid
+        ''', (match, tier, tier, status, status))]
+
+@pytest.mark.parametrize('tier, status', [(None, None), ('JUNIOR', 'WAITING'), ('SENIOR', 'COMPLETED')])
+def test_search_pages_reach_every_filtered_match(fresh_db, tier, status):
+    seed_search_visits(4000, seed=4)
+    with connection.get_read_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM archive.visits_archive').fetchone()[0] > 0
+    expected = fts_order('"knee" "injury"*', tier, status)
+    assert len(expected) > 7
+    found, cursor = [], None
+    while True:
+        page, cursor = visit_repo.search_visits('knee injury', tier=tier, status=status, limit=7,
+                                                cursor=cursor)
+        assert all('**' in visit['snippet'] for visit in page)
+        found += [visit['id'] for visit in page]
+        if cursor is None:
+            break
+    assert found == expected
+
+def seed_history(count):
+    """Visits of patient 9000000002, visit i completed just under i days ago
+    (every fourth one still waiting); those past the 30-day cutoff get archived"""
+    with connection.get_db() as conn:
+        conn.executemany('''
+            INSERT INTO visits (patient_phone, symptoms_raw, risk_score, assigned_tier, status,
+                                created_at, completed_at)
+            VALUES ('9000000002', ?, 0.5, 'JUNIOR', ?, datetime('now', ?), datetime('now', ?, '+1 hours'))
+        ''', [(f'visit {i}', 'WAITING' if i % 4 == 0 else 'COMPLETED', f'-{i + 1} days', f'-{i} days')
+              for i in range(count)])
+
+def all_visit_ids():
+    with connection.get_read_db() as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM all_visits ORDER BY id')]
+
+def test_archive_moves_each_visit_exactly_once(fresh_db):
+    seed_history(60)
+    before = all_visit_ids()
+    history = [visit['id'] for visit in visit_repo.get_previous_visits('9000000002', limit=100)]
+    assert archive_completed_visits(batch_size=7) == 22
+    with connection.get_read_db() as conn:
+        live = {row[0] for row in conn.execute('SELECT id FROM main.visits')}
+        archived = {row[0] for row in conn.execute('SELECT id FROM archive.visits_archive')}
+    assert not live & archived and len(archived) == 22
+    assert all_visit_ids() == before
+    assert [visit['id'] for visit in visit_repo.get_previous_visits('9000000002', limit=100)] == history
+    assert archive_completed_visits() == 0
+
+def test_archive_recovers_from_a_crash_between_copy_and_delete(fresh_db):
+    seed_history(40)
+    before = all_visit_ids()
+    # The first transaction of a batch committed, the delete never ran
+    with connection.get_db() as conn:
+        conn.execute('''
+            INSERT INTO archive.visits_archive (id, patient_phone, symptoms_raw, status, created_at)
+            SELECT id, patient_phone, 'stale copy', status, created_at FROM main.visits
+            WHERE status = 'COMPLETED' AND id > 35
+        ''')
+    assert all_visit_ids() == before
+    previous = visit_repo.get_previous_visits('9000000002', limit=100)
+    assert 'stale copy' not in {visit['symptoms_raw'] for visit in previous}
+    assert archive_completed_visits() == 7
+    assert all_visit_ids() == before
+    with connection.get_read_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM all_visits WHERE symptoms_raw = 'stale copy'").fetchone()[0] == 0
+
+def test_ranks_follow_the_queue_order_with_unscored_visits(fresh_db):
+    # DESC puts NULL scores last; two unscored visits tie and keep arrival order
+    scores = [0.5, None, 0.0, None, 0.5, 0.9]
+    visit_ids = [visit_repo.create_visit(f'90000000{i:02d}', f'symptoms {i}', [], score, 'LOW', 'JUNIOR')
+                 for i, score in enumerate(scores)]
+    order = [visit['id'] for visit in visit_repo.get_waiting_visits('JUNIOR')]
+    assert order == [visit_ids[i] for i in (5, 0, 4, 2, 1, 3)]
+    expected = {visit_id: order.index(visit_id) + 1 for visit_id in visit_ids}
+    assert visit_repo.get_visit_ranks(visit_ids) == expected
+    assert [visit_repo.get_visit_rank(visit_id) for visit_id in visit_ids] == \
+        [expected[visit_id] for visit_id in visit_ids]
+
+def assert_engine_matches_sql(engine):
+    for tier in ('JUNIOR', 'SENIOR'):
+        expected = [visit['id'] for visit in visit_repo.get_waiting_visits(tier)]
+        assert [visit['id'] for visit in engine.waiting(tier)] == expected
+        assert engine.ranks(expected) == visit_repo.get_visit_ranks(expected)
+
+def test_engine_order_and_ranks_match_sql(fresh_db):
+    rng = random.Random(5)
+    engine = QueueEngine()
+    claimed = []
+
+    def score():
+        return rng.choice([None, 0.0, 0.5, round(rng.random(), 2)])
+
+    try:
+        for step in range(300):
+            tier = rng.choice(['JUNIOR', 'SENIOR'])
+            action = rng.random()
+            if action < 0.4:
+                engine.enqueue(f'90000000{step % 10:02d}', f'symptoms {step}', [], score(), 'LOW', tier)
+            elif action < 0.55:
+                # Written by another process: only sync() brings it in
+                visit_repo.create_visit(f'90000000{step % 10:02d}', f'kiosk {step}', [], score(), 'LOW', tier)
+            elif action < 0.75:
+                visit = engine.claim_next(tier, doctor_id=step % 3 + 1)
+                if visit is not None:
+                    claimed.append(visit)
+            elif action < 0.9 and claimed:
+                visit = claimed.pop(rng.randrange(len(claimed)))
+                engine.release(visit['id'], visit['claimed_by'])
+            elif claimed:
+                engine.complete(claimed.pop()['id'], 'done')
+            if step % 10 == 9:
+                engine.sync()
+                assert_engine_matches_sql(engine)
+        engine.sync()
+        assert_engine_matches_sql(engine)
+        assert any(visit['risk_score'] is None for visit in engine.waiting('JUNIOR') + engine.waiting('SENIOR'))
+    finally:
+        engine.close()
+
+def test_create_visit_derives_missing_risk_features(fresh_db):
+    symptoms = 'Fever and a severe headache'
+    visit_id = visit_repo.create_visit('9000000003', symptoms, [symptoms], 0.5, 'MEDIUM', 'JUNIOR')
+    unknown_id = visit_repo.create_visit('0000000000', 'chest pain', ['chest pain'], 0.8, 'HIGH', 'SENIOR')
+    with connection.get_read_db() as conn:
+        row = conn.execute('SELECT risk_features, fever, headache, chest_pain, age FROM visits WHERE id = ?',
+                           (visit_id,)).fetchone()
+        unknown = conn.execute('SELECT chest_pain, age FROM visits WHERE id = ?', (unknown_id,)).fetchone()
+    age = datetime.now().year - 1953
+    assert json.loads(row['risk_features']) == risk_features(symptoms, age)
+    assert (row['fever'], row['headache'], row['chest_pain'], row['age']) == (1, 1, 0, age)
+    assert (unknown['chest_pain'], unknown['age']) == (1, None)
+    assert [(r['assigned_tier'], r['visits']) for r in visit_repo.get_feature_counts('fever')] == [('JUNIOR', 1)]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -4,6 +4,7 @@ Database verification script - Shows current database state
 """
 
 from db.connection import get_db
+from db.visit_repo import get_queue_stats
 
 def show_db_status():
     print("=" * 60)
@@ -33,18 +34,14 @@ def show_db_status():
         visit_count = cursor.fetchone()['count']
         print(f"\n✓ Visits table: {visit_count} records")
         
-        # Check pending queue
-        cursor.execute('''
-            SELECT assigned_tier, COUNT(*) as count 
-            FROM visits 
-            WHERE status = 'WAITING' 
-            GROUP BY assigned_tier
-        ''')
+        # Check pending queue (trigger-maintained counters, no scan)
         print(f"\n✓ Current Queue:")
-        queue = cursor.fetchall()
+        queue = {tier: stats for tier, stats in get_queue_stats().items()
+                 if stats['waiting_count'] or stats['in_progress_count']}
         if queue:
-            for row in queue:
-                print(f"  - {row['assigned_tier']}: {row['count']} waiting")
+            for tier, stats in queue.items():
+                print(f"  - {tier}: {stats['waiting_count']} waiting, "
+                      f"{stats['in_progress_count']} in progress")
         else:
             print(f"  - No patients in queue")
     